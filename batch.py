@@ -0,0 +1,310 @@
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, Iterator, List, Optional, TextIO, Tuple
+
+import battle
+import nqueens
+from csp import CSP, FORWARD_CHECKING, PROPAGATION_LEVELS
+from heuristics import VALUE_ORDERINGS, VARIABLE_ORDERINGS, make_value_ordering
+
+
+NQUEENS = "nqueens"
+BATTLE = "battle"
+PUZZLE_KINDS = [NQUEENS, BATTLE]
+
+# Outcomes of a puzzle
+SOLVED = "solved"
+UNSATISFIABLE = "unsatisfiable"
+NODE_LIMIT = "node-limit"
+ERROR = "error"
+
+# Puzzles handed to the pool per worker before waiting for a result, so that
+# only a bounded number of puzzles are held in memory at once
+TASKS_PER_WORKER = 2
+
+# Puzzles a worker solves before it is replaced, which returns any memory a
+# large puzzle left behind in it
+MAX_TASKS_PER_CHILD = 1000
+
+# Name and lines of one puzzle
+Task = Tuple[str, List[str]]
+Result = Dict[str, Any]
+
+
+def read_records(source: str) -> Iterator[Task]:
+    """
+    Puzzles of <source>: every file of a directory in name order, or the
+    records of a file, separated by blank lines. "-" reads standard input.
+    Puzzles are read one at a time, as they are needed.
+    """
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            path = os.path.join(source, name)
+            if os.path.isfile(path):
+                with open(path) as file:
+                    yield name, file.readlines()
+        return
+
+    if source == "-":
+        yield from _split_records("stdin", sys.stdin)
+        return
+    with open(source) as file:
+        yield from _split_records(os.path.basename(source), file)
+
+
+def _split_records(name: str, file: TextIO) -> Iterator[Task]:
+    record: List[str] = []
+    index = 0
+    for line in file:
+        if line.strip():
+            record.append(line)
+        elif len(record) > 0:
+            index += 1
+            yield f"{name}#{index}", record
+            record = []
+    if len(record) > 0:
+        yield f"{name}#{index + 1}", record
+
+
+class BatchSolver:
+    """
+    Solves single puzzles of one kind into JSON-ready results. It is
+    picklable, so pool workers can run its solve method.
+    """
+
+    def __init__(
+        self,
+        kind: str,
+        variable_ordering: Optional[str] = None,
+        value_ordering: str = "lexical",
+        seed: Optional[int] = None,
+        node_limit: Optional[int] = None,
+        stats: bool = False,
+        propagation: str = FORWARD_CHECKING
+        ) -> None:
+        if kind not in PUZZLE_KINDS:
+            raise ValueError(f"Unknown puzzle kind '{kind}'")
+        if propagation not in PROPAGATION_LEVELS:
+            raise ValueError(f"Unknown propagation level '{propagation}'")
+        self.kind = kind
+        self.variable_ordering = variable_ordering
+        self.value_ordering = value_ordering
+        self.seed = seed
+        self.node_limit = node_limit
+        self.collect_stats = stats
+        # Only used by battleship puzzles, as nqueens.py has no such option
+        self.propagation = propagation
+
+    def solve(self, task: Task) -> Result:
+        """
+        Result of the puzzle in <task>, with its status, the solution if one
+        was found, the seconds taken and search statistics. A puzzle that
+        cannot be read or modelled gets an error status rather than ending
+        the batch.
+        """
+        name, lines = task
+        start = time.perf_counter()
+        try:
+            csp, format_solution = self._build(lines)
+            found = csp.search(node_limit=self.node_limit)
+        except Exception as error:
+            return {
+                "puzzle": name,
+                "status": ERROR,
+                "error": f"{type(error).__name__}: {error}",
+                "seconds": round(time.perf_counter() - start, 6),
+            }
+
+        if found is None:
+            status = NODE_LIMIT
+        else:
+            status = SOLVED if found else UNSATISFIABLE
+        return {
+            "puzzle": name,
+            "status": status,
+            "solution": format_solution(csp) if found else None,
+            "seconds": round(time.perf_counter() - start, 6),
+            "stats": csp.stats.as_dict() if csp.stats is not None else
+                {"nodes": csp.nodes, "failures": csp.failures},
+        }
+
+    def _build(self, lines: List[str]) -> Tuple[CSP, Callable[[CSP], Any]]:
+        """Fresh CSP of the puzzle, and how to turn its assignment into a solution"""
+        if self.kind == NQUEENS:
+            dimension, starting_queens = nqueens.parse_input(lines)
+            solver = nqueens.NQueensSolver(
+                dimension, starting_queens,
+                variable_ordering=self.variable_ordering or "input",
+                value_ordering=self.value_ordering,
+                seed=self.seed,
+                stats=self.collect_stats
+            )
+            return solver.build(), lambda csp: [
+                csp.assignment()[row] for row in range(dimension)
+            ]
+
+        row_sums, col_sums, ship_count, grid = battle.parse_input(lines)
+        csp = battle.build_csp(
+            row_sums, col_sums, ship_count, grid,
+            value_ordering=make_value_ordering(self.value_ordering, self.seed),
+            propagation=self.propagation,
+            variable_ordering=self.variable_ordering or "mrv",
+            stats=self.collect_stats
+        )
+        return csp, lambda csp: [
+            "".join(row)
+            for row in battle.format_output(battle.generate_variables(grid), csp.assignment())
+        ]
+
+
+def run_batch(
+    solver: BatchSolver,
+    tasks: Iterator[Task],
+    output: TextIO,
+    workers: int = 1
+    ) -> Counter:
+    """
+    Writes the result of every task to <output> as a JSON line as soon as it
+    is known, in the order the puzzles finish, and returns how many ended
+    with each status. Each of the <workers> processes has at most
+    TASKS_PER_WORKER puzzles queued, whatever the size of the batch.
+    """
+    statuses: Counter = Counter()
+
+    def write(result: Result) -> None:
+        statuses[result["status"]] += 1
+        output.write(json.dumps(result, separators=(",", ":")))
+        output.write("\n")
+        output.flush()
+
+    if workers <= 1:
+        for task in tasks:
+            write(solver.solve(task))
+        return statuses
+
+    context = multiprocessing.get_context()
+    results: queue.Queue = queue.Queue()
+    running = 0
+
+    def wait() -> None:
+        nonlocal running
+        result = results.get()
+        running -= 1
+        if isinstance(result, BaseException):
+            raise result
+        write(result)
+
+    pool = context.Pool(workers, maxtasksperchild=MAX_TASKS_PER_CHILD)
+    try:
+        for task in tasks:
+            if running >= workers * TASKS_PER_WORKER:
+                wait()
+            pool.apply_async(
+                solver.solve, (task,), callback=results.put, error_callback=results.put
+            )
+            running += 1
+        while running > 0:
+            wait()
+    finally:
+        pool.terminate()
+        pool.join()
+
+    return statuses
+
+
+def main(
+    kind: str,
+    source: str,
+    output_filename: Optional[str] = None,
+    workers: int = 1,
+    variable_ordering: Optional[str] = None,
+    value_ordering: str = "lexical",
+    seed: Optional[int] = None,
+    node_limit: Optional[int] = None,
+    stats: bool = False,
+    propagation: str = FORWARD_CHECKING
+    ) -> None:
+
+    solver = BatchSolver(
+        kind, variable_ordering, value_ordering, seed, node_limit, stats, propagation
+    )
+    output = open(output_filename, 'w') if output_filename is not None else sys.stdout
+    start = time.perf_counter()
+    try:
+        statuses = run_batch(solver, read_records(source), output, workers)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    # Kept off standard output, which may be carrying the results
+    summary = ", ".join(f"{count} {status}" for status, count in sorted(statuses.items()))
+    print(
+        f"{sum(statuses.values())} puzzles in {time.perf_counter() - start:.3f}s"
+        + (f": {summary}" if summary else ""),
+        file=sys.stderr
+    )
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Solves many puzzles, writing one JSON line per puzzle"
+    )
+    parser.add_argument("kind", choices=PUZZLE_KINDS)
+    parser.add_argument(
+        "source",
+        help="directory with one puzzle per file, or a file of puzzles "
+        "separated by blank lines ('-' for standard input)"
+    )
+    parser.add_argument(
+        "--output", default=None, metavar="RESULTS_FILE",
+        help="write the results to this file instead of standard output"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="number of processes solving puzzles at the same time"
+    )
+    parser.add_argument(
+        "--variable-order", choices=list(VARIABLE_ORDERINGS), default=None,
+        help="heuristic used to pick the next variable, by default that of "
+        "the single puzzle solver"
+    )
+    parser.add_argument(
+        "--value-order", choices=list(VALUE_ORDERINGS), default="lexical",
+        help="order in which the values of a variable are tried"
+    )
+    parser.add_argument(
+        "--seed", type=int, default=None, help="seed for --value-order random"
+    )
+    parser.add_argument(
+        "--propagation", choices=PROPAGATION_LEVELS, default=FORWARD_CHECKING,
+        help="consistency enforced after each assignment in battleship puzzles"
+    )
+    parser.add_argument(
+        "--node-limit", type=int, default=None,
+        help="give up on a puzzle after visiting this many search nodes"
+    )
+    parser.add_argument(
+        "--stats", action="store_true",
+        help="report full search statistics rather than only nodes and failures"
+    )
+    args = parser.parse_args()
+
+    main(
+        kind=args.kind,
+        source=args.source,
+        output_filename=args.output,
+        workers=args.workers,
+        variable_ordering=args.variable_order,
+        value_ordering=args.value_order,
+        seed=args.seed,
+        node_limit=args.node_limit,
+        stats=args.stats,
+        propagation=args.propagation
+    )
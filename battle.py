@@ -1,9 +1,23 @@
-import copy
-import sys
-from abc import ABC, abstractmethod
+import argparse
+import functools
 from enum import Enum
 from typing import *
 
+from csp import (
+    CSP, FORWARD_CHECKING, PROPAGATION_LEVELS, Assignment, Constraint,
+    GlobalConstraint, Removals, SearchListener
+)
+from csp_builder import CSPBuilder
+from domains import DomainStore
+from heuristics import (
+    VALUE_ORDERINGS, VARIABLE_ORDERINGS, ValueOrdering, VariableOrdering,
+    make_value_ordering
+)
+from parallel import ParallelSolver
+from portfolio import PortfolioResult, PortfolioSolver
+from restarts import RESTART_SCHEDULES
+from tracing import TraceRecorder
+
 
 Grid = List[List[str]]
 Cell = Tuple[int, int]
@@ -52,91 +66,224 @@ class Piece:
     def __repr__(self) -> str:
         return f"Id: {self.id}, Type: {self.ptype}, orient: {self.orientation}"
 
-    def __eq__(self, other: 'Piece') -> bool:
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Piece):
+            return NotImplemented
         if self.id == other.id and self.ptype == other.ptype and self.orientation == other.orientation:
             return True
         return False
 
+    def __hash__(self) -> int:
+        return hash((self.id, self.ptype, self.orientation))
 
-class Constraint(ABC):
 
-    scope: List[Cell] = []
+class BattleConstraint(Constraint):
 
-    def  __init__(self, scope: List[Cell]) -> None:
-        self.scope = scope
+    def _pieces(self, assignment: Assignment) -> List[Piece]:
+        # Pieces in scope order
+        return [assignment[cell] for cell in self.scope]
 
-    def _id_and_orient_match(self, assignment: List[Piece]) -> bool:
-        id = assignment[0].id
-        orientation = assignment[0].orientation
-        for a in assignment:
+    def _id_and_orient_match(self, pieces: List[Piece]) -> bool:
+        id = pieces[0].id
+        orientation = pieces[0].orientation
+        for a in pieces:
             if (a.id != id) or (a.orientation != orientation):
                 return False
         return True
 
-    @abstractmethod
-    # The order of variable assignments in parameter <assignment>
-    # must match order of variables in scope
-    def is_satisfied(self, assignment: List[Piece]) -> bool:
-        pass
 
+class ShipConstraint(BattleConstraint):
 
-class DestroyerConstraint(Constraint):
+    # Piece types expected at each position of the scope, in order
+    segments: List[PieceType] = []
 
-    def is_satisfied(self, assignment: List[Piece]) -> bool:
-        if len(assignment) != 2:
-            raise Exception("Invalid (horizontal) Destroyer Assignment")
+    def __init__(self, scope: List[Cell]) -> None:
+        super().__init__(scope)
+        # Horizontal if the scope stays within one row
+        self.orientation = Piece.H if scope[0][0] == scope[1][0] else Piece.V
 
-        if assignment[0].ptype != PieceType.D_S:
+    def is_satisfied(self, assignment: Assignment) -> bool:
+        pieces = self._pieces(assignment)
+        if len(pieces) != len(self.segments):
+            raise Exception(f"Invalid {type(self).__name__} Assignment")
+        return self._holds(pieces)
+
+    def filter_supported(
+        self,
+        variable: Cell,
+        values: List[Piece],
+        assignment: Assignment
+        ) -> List[bool]:
+        position = self.scope.index(variable)
+        pieces = [assignment.get(cell) for cell in self.scope]
+        supported = []
+        for value in values:
+            pieces[position] = value
+            supported.append(self._holds(pieces))
+        return supported
+
+    def _holds(self, pieces: List[Piece]) -> bool:
+        # The constraint only applies when some cell holds the segment of this
+        # ship that belongs at its position, with this scope's orientation
+        for piece, segment in zip(pieces, self.segments):
+            if piece.ptype == segment and piece.orientation == self.orientation:
+                break
+        else:
             return True
-        return assignment[1].ptype == PieceType.D_E and \
-            self._id_and_orient_match(assignment)
 
+        for piece, segment in zip(pieces, self.segments):
+            if piece.ptype != segment:
+                return False
+        return self._id_and_orient_match(pieces) and \
+            pieces[0].orientation == self.orientation
 
-class CruiserConstraint(Constraint):
 
-    def is_satisfied(self, assignment: List[Piece]) -> bool:
-        if len(assignment) != 3:
-            raise Exception("Invalid (horizontal) Cruiser Assignment")
+class DestroyerConstraint(ShipConstraint):
 
-        if assignment[0].ptype != PieceType.C_S:
-            return True
-        return assignment[1].ptype == PieceType.C_M and \
-            assignment[2].ptype == PieceType.C_E and \
-            self._id_and_orient_match(assignment)
+    segments = [PieceType.D_S, PieceType.D_E]
 
 
-class BattleshipConstraint(Constraint):
+class CruiserConstraint(ShipConstraint):
 
-    def is_satisfied(self, assignment: List[Piece]) -> bool:
-        if len(assignment) != 4:
-            raise Exception("Invalid (horizontal) Battleship Assignment")
+    segments = [PieceType.C_S, PieceType.C_M, PieceType.C_E]
 
-        if assignment[0].ptype != PieceType.B_S:
-            return True
-        return assignment[1].ptype == PieceType.B_M1 and \
-            assignment[2].ptype == PieceType.B_M2 and \
-            assignment[3].ptype == PieceType.B_E and \
-            self._id_and_orient_match(assignment)
 
+class BattleshipConstraint(ShipConstraint):
+
+    segments = [PieceType.B_S, PieceType.B_M1, PieceType.B_M2, PieceType.B_E]
 
-class LineSumConstraint(Constraint):
+
+class LineSumConstraint(GlobalConstraint):
+
+    # Counts the line's cells that are committed to a ship (no water left in
+    # their domain), committed to water or still open. Once the ships meet the
+    # sum the open cells are forced to water, and once every open cell is
+    # needed they are forced to ships. The counts are kept between calls and
+    # only the changed cell is looked at again; changes to them go on the
+    # domain trail and are undone on backtrack
+
+    SHIP = 0
+    WATER = 1
+    OPEN = 2
 
     sum: int = 0
 
     def __init__(self, scope: List[Cell], sum: int) -> None:
         super().__init__(scope)
         self.sum = sum
-
-    def is_satisfied(self, assignment: List[Piece]) -> bool:
+        # Store the counts are kept for, and each cell's class in it. A
+        # constraint reused by another CSP counts its line over again
+        self.store: Optional[DomainStore] = None
+        self.kinds: Dict[Cell, int] = {}
+        self.counts = [0, 0, 0]
+        # Class of the committed cells that decided the outcome of the last
+        # propagate()
+        self.reason = self.SHIP
+
+    def is_satisfied(self, assignment: Assignment) -> bool:
         curr_sum = 0
-        for value in assignment:
+        for value in self._pieces(assignment):
             if value.ptype != PieceType.Water:
                 curr_sum += 1
 
         return self.sum == curr_sum
 
+    def _pieces(self, assignment: Assignment) -> List[Piece]:
+        return [assignment[cell] for cell in self.scope]
+
+    def propagate(
+        self,
+        domains: DomainStore,
+        changed: Optional[Cell]
+        ) -> Optional[Removals]:
+
+        if domains is not self.store:
+            # Counted from the domains at this depth, so backtracking above it
+            # has the line counted over again
+            domains.push_undo(self, (domains, None, None))
+            self.store = domains
+            self.kinds = {cell: self.OPEN for cell in self.scope}
+            self.counts = [0, 0, len(self.scope)]
+            changed = None
+
+        for cell in self.scope if changed is None else [changed]:
+            self._recount(domains, cell, self._kind(domains, cell))
+
+        ships, waters, open_cells = self.counts
+        # Too many ships, or pruning water, is down to the committed ships;
+        # too few, or pruning ships, to the committed water
+        if ships > self.sum:
+            self.reason = self.SHIP
+            return None
+        if ships + open_cells < self.sum:
+            self.reason = self.WATER
+            return None
+
+        if open_cells > 0 and ships == self.sum:
+            self.reason = self.SHIP
+            return self._force(domains, water=True)
+        if open_cells > 0 and ships + open_cells == self.sum:
+            self.reason = self.WATER
+            return self._force(domains, water=False)
+
+        return []
+
+    def undo(self, token: Tuple[DomainStore, Optional[Cell], Optional[int]]) -> None:
+        store, cell, kind = token
+        if store is not self.store:
+            return
+        if cell is None:
+            self.store = None
+            return
+        self.counts[self.kinds[cell]] -= 1
+        self.counts[kind] += 1
+        self.kinds[cell] = kind
+
+    def explain(self, variable: Cell, value: Piece) -> List[Cell]:
+        return self._cells(self.reason)
+
+    def explain_failure(self) -> List[Cell]:
+        return self._cells(self.reason)
+
+    def _cells(self, kind: int) -> List[Cell]:
+        return [cell for cell in self.scope if self.kinds[cell] == kind]
+
+    def _kind(self, domains: DomainStore, cell: Cell) -> int:
+        has_water = False
+        has_ship = False
+        for value in domains[cell]:
+            if value.ptype == PieceType.Water:
+                has_water = True
+            else:
+                has_ship = True
+        if not has_water:
+            return self.SHIP
+        return self.OPEN if has_ship else self.WATER
+
+    def _recount(self, domains: DomainStore, cell: Cell, kind: int) -> None:
+        old = self.kinds[cell]
+        if old == kind:
+            return
+        domains.push_undo(self, (domains, cell, old))
+        self.counts[old] -= 1
+        self.counts[kind] += 1
+        self.kinds[cell] = kind
+
+    def _force(self, domains: DomainStore, water: bool) -> Removals:
+        # The forced cells are counted now, as the pruning they cause is not
+        # reported back to this constraint
+        removals = []
+        for cell in self.scope:
+            if self.kinds[cell] != self.OPEN:
+                continue
+            for value in domains[cell]:
+                if (value.ptype == PieceType.Water) != water:
+                    removals.append((cell, value))
+            self._recount(domains, cell, self.WATER if water else self.SHIP)
+        return removals
+
 
-class DiagonalConstraint(Constraint):
+class DiagonalConstraint(BattleConstraint):
 
     # d1 is the top diagonal in pair, d2 is bottom
     def __init__(self, scope: List[Cell]) -> None:
@@ -145,177 +292,179 @@ class DiagonalConstraint(Constraint):
             raise Exception("Invalid diagonal")
         super().__init__(scope)
 
-    def is_satisfied(self, assignment: List[Piece]) -> bool:
-        return assignment[0].ptype == PieceType.Water or assignment[1].ptype == PieceType.Water
+    def is_satisfied(self, assignment: Assignment) -> bool:
+        d1, d2 = self.scope
+        return assignment[d1].ptype == PieceType.Water or \
+            assignment[d2].ptype == PieceType.Water
 
+    def filter_supported(
+        self,
+        variable: Cell,
+        values: List[Piece],
+        assignment: Assignment
+        ) -> List[bool]:
+        d1, d2 = self.scope
+        if assignment[d2 if variable == d1 else d1].ptype == PieceType.Water:
+            return [True] * len(values)
+        return [value.ptype == PieceType.Water for value in values]
+
+
+class AdjacencyConstraint(BattleConstraint):
+
+    # Segment that must follow each piece type within the same ship
+    NEXT_SEGMENT = {
+        PieceType.D_S: PieceType.D_E,
+        PieceType.C_S: PieceType.C_M,
+        PieceType.C_M: PieceType.C_E,
+        PieceType.B_S: PieceType.B_M1,
+        PieceType.B_M1: PieceType.B_M2,
+        PieceType.B_M2: PieceType.B_E,
+    }
+
+    # a1 is the left (or top) cell in pair, a2 is right (or bottom)
+    def __init__(self, scope: List[Cell]) -> None:
+        a1, a2 = scope
+        if abs(a1[0] - a2[0]) + abs(a1[1] - a2[1]) != 1:
+            raise Exception("Invalid adjacency")
+        super().__init__(scope)
+        self.orientation = Piece.H if a1[0] == a2[0] else Piece.V
 
-class UniqueConstraint(Constraint):
-
-    def is_satisfied(self, assignment: List[Piece]) -> bool:
-
-        c1, c2 = assignment
-
-        if (c1.ptype == PieceType.Water) or (c2.ptype == PieceType.Water):
-            return True
-        if c1.ptype != c2.ptype:
-            return True
-        if c1.id == c2.id:
-            return False
-        return True
-
-
-class CSP:
-
-    values: Dict[Cell, Piece]
-    variables: List[Cell]
-    domains: Dict[Cell, List[Piece]]
-    constraints: List[Constraint]
-
-    vars_to_cons: Dict[Cell, List[Constraint]]
-    pruned_domains: Dict[int, Dict[Cell, List[Piece]]]
-    assigned: Dict[Cell, bool]
-    gac_stack: List[Constraint]
+    def is_satisfied(self, assignment: Assignment) -> bool:
+        p1, p2 = self._pieces(assignment)
+        return self._compatible(p1, p2)
 
-    def __init__(
+    def filter_supported(
         self,
-        variables: List[Cell],
-        domains: Dict[Cell, List[Piece]],
-        constraints: List[Constraint],
-        vars_to_cons: Dict[Cell, List[Constraint]]
-        ) -> None:
-        self.values = {}
-        self.variables = variables
-        self.domains = domains
-        self.constraints = constraints
-
-        self.vars_to_cons = vars_to_cons
-        self.pruned_domains = {}
-        self._init_assigned()
-        self.gac_stack = []
-
-    def satisfy(self) -> bool:
-        return self._fc(0)
-
-    def _init_assigned(self) -> None:
-        self.assigned = {}
-        for variable in self.variables:
-            self.assigned[variable] = False
-            self.values[variable] = None
-
-    def _fc(self, level: int) -> bool:
-
-        var = self._pick_unassigned_variable()
-        if var is None:
+        variable: Cell,
+        values: List[Piece],
+        assignment: Assignment
+        ) -> List[bool]:
+        a1, a2 = self.scope
+        if variable == a1:
+            p2 = assignment[a2]
+            return [self._compatible(p1, p2) for p1 in values]
+        p1 = assignment[a1]
+        return [self._compatible(p1, p2) for p2 in values]
+
+    def _compatible(self, p1: Piece, p2: Piece) -> bool:
+        if p1.ptype == PieceType.Water or p2.ptype == PieceType.Water:
             return True
+        # Two neighbouring ship cells must be consecutive segments of one ship
+        return self.NEXT_SEGMENT.get(p1.ptype) == p2.ptype and \
+            p1.id == p2.id and \
+            p1.orientation == self.orientation and \
+            p2.orientation == self.orientation
 
-        self.pruned_domains[level] = {}
-        self.assigned[var] = True
 
-        for value in self.domains[var]:
+class ShipIdentityConstraint(GlobalConstraint):
 
-            self.values[var] = value
-            dwo = False
+    # Every ship segment (piece type and ship id) appears in at most one cell.
+    # Cells that could hold each segment are indexed up front, so fixing a
+    # segment only touches the cells that could also hold it
 
-            for constraint in self.vars_to_cons[var]:
-                count, unassigned_var = self._get_last_unassigned(constraint)
-                # Only one unassigned variable in scope
-                if count == 1 and unassigned_var is not None:
-                    if self._fc_check(constraint, unassigned_var, level):
-                        dwo = True
-                        break
-
-            if not dwo:
-                if self._fc(level + 1):
-                    return True
-            # Restore all pruned values
-            for pruned_var in self.pruned_domains[level]:
-                self.domains[pruned_var].extend(self.pruned_domains[level][pruned_var])
-            self.pruned_domains[level] = {}
-
-        self.values[var] = None
-        self.assigned[var] = False
-
-        return False
-
-    def _fc_check(self, constraint: Constraint, var: Cell, level: int) -> bool:
-
-        assignment = [None] * len(constraint.scope)
-        var_i = 0
-
-        for i in range(len(constraint.scope)):
-            con_var = constraint.scope[i]
-            if con_var == var:
-                var_i = i
-            else:
-                assignment[i] = self.values[con_var]
-
-        og_domain = copy.copy(self.domains[var])
-
-        for value in og_domain:
-            assignment[var_i] = value
-            if not constraint.is_satisfied(assignment):
-                # Prune value
-                self.domains[var].remove(value)
-                if var not in self.pruned_domains[level]:
-                    self.pruned_domains[level][var] = []
-                self.pruned_domains[level][var].append(value)
-            if len(self.domains[var]) == 0:
-                return True
-
-        return False
-
-    def _get_last_unassigned(
-        self, constraint: Constraint) -> Tuple[int, Optional[Cell]]:
-
-        unassigned_count = 0
-        unassigned_var = None
-
-        for var in constraint.scope:
-            if self.assigned[var] == False:
-                unassigned_count += 1
-                unassigned_var = var
+    def __init__(self, scope: List[Cell], domains: Dict[Cell, List[Piece]]) -> None:
+        super().__init__(scope)
+        self.holders: Dict[Tuple[PieceType, int], List[Cell]] = {}
+        for cell in scope:
+            keys = set()
+            for piece in domains[cell]:
+                if piece.ptype != PieceType.Water:
+                    keys.add((piece.ptype, piece.id))
+            for key in keys:
+                if key not in self.holders:
+                    self.holders[key] = []
+                self.holders[key].append(cell)
+        # Cell holding each segment claimed by the last propagate(), and the
+        # two cells it found claiming the same segment
+        self.claimed: Dict[Tuple[PieceType, int], Cell] = {}
+        self.clash: List[Cell] = []
+
+    def is_satisfied(self, assignment: Assignment) -> bool:
+        seen = set()
+        for cell in self.scope:
+            piece = assignment[cell]
+            if piece.ptype == PieceType.Water:
+                continue
+            key = (piece.ptype, piece.id)
+            if key in seen:
+                return False
+            seen.add(key)
+        return True
 
-        return unassigned_count, unassigned_var
+    def propagate(
+        self,
+        domains: DomainStore,
+        changed: Optional[Cell]
+        ) -> Optional[Removals]:
+
+        removals = []
+        claimed: Dict[Tuple[PieceType, int], Cell] = {}
+        cells = self.scope if changed is None else [changed]
+
+        for cell in cells:
+            # A segment is claimed once every piece left in a cell is that
+            # segment (in either orientation)
+            keys = {(piece.ptype, piece.id) for piece in domains[cell]}
+            if len(keys) != 1:
+                continue
+            key = keys.pop()
+            if key[0] == PieceType.Water:
+                continue
+            if key in claimed:
+                self.clash = [claimed[key], cell]
+                return None
+            claimed[key] = cell
 
-    def _pick_unassigned_variable(self) -> Optional[Cell]:
+            for other in self.holders[key]:
+                if other == cell:
+                    continue
+                for value in domains[other]:
+                    if value.ptype == key[0] and value.id == key[1]:
+                        removals.append((other, value))
 
-        mrv_variable: Optional[Cell] = None
-        min_domain = 1000
+        self.claimed = claimed
+        return removals
 
-        for variable in self.variables:
-            if self.assigned[variable]:
-                continue
-            domain_len = len(self.domains[variable])
-            if domain_len < min_domain:
-                min_domain = domain_len
-                mrv_variable = variable
+    def explain(self, variable: Cell, value: Piece) -> List[Cell]:
+        return [self.claimed[(value.ptype, value.id)]]
 
-        return mrv_variable
+    def explain_failure(self) -> List[Cell]:
+        return self.clash
 
 
 def read_input(
     input_filename: str
 ) -> Tuple[List[int], List[int], List[int], Grid]:
 
-    row_cons = []
-    col_cons = []
-    ship_cons = []
-    grid = []
-
     with open(input_filename) as file:
+        return parse_input(file.readlines())
 
-        lines = file.readlines()
 
-        row_cons = [int(i) for i in lines[0].strip()]
-        col_cons = [int(i) for i in lines[1].strip()]
-        ship_cons = [int(i) for i in lines[2].strip()]
+def parse_input(
+    lines: List[str]
+) -> Tuple[List[int], List[int], List[int], Grid]:
 
-        for line in lines[3:]:
-            grid.append([*line.strip()])
+    row_cons = read_numbers(lines[0])
+    col_cons = read_numbers(lines[1])
+    ship_cons = read_numbers(lines[2])
+
+    grid = []
+    for line in lines[3:]:
+        grid.append([*line.strip()])
 
     return row_cons, col_cons, ship_cons, grid
 
 
+def read_numbers(line: str) -> List[int]:
+
+    # Whitespace-separated numbers, which larger grids need for sums above 9,
+    # or one digit per character
+    fields = line.split()
+    if len(fields) > 1:
+        return [int(field) for field in fields]
+    return [int(i) for i in line.strip()]
+
+
 def generate_ship_pieces(ship_count: List[int]) -> PossiblePieces:
 
     # submarines, destroyers, cruisers and battleships
@@ -485,26 +634,9 @@ def generate_domain_from_hint(
     return []
 
 
-def add_constraint_for_var(
-    vars_to_cons: Dict[Cell, List[Constraint]],
-    var: Cell,
-    constraint: Constraint) -> None:
-    if var not in vars_to_cons:
-        vars_to_cons[var] = []
-    vars_to_cons[var].append(constraint)
-
-
-def add_constraint_for_vars(
-    vars_to_cons: Dict[Cell, List[Constraint]],
-    vars: List[Cell],
-    constraint: Constraint) -> None:
-    for var in vars:
-        add_constraint_for_var(vars_to_cons, var, constraint)
-
-
 def generate_sum_cons(
+    builder: CSPBuilder,
     vars: List[List[Cell]],
-    vars_to_cons: Dict[Cell, List[Constraint]],
     row_sums: List[int],
     col_sums: List[int]) -> List[LineSumConstraint]:
 
@@ -514,21 +646,20 @@ def generate_sum_cons(
     for index, row in enumerate(vars):
         row_sum_con = LineSumConstraint(scope=row, sum=row_sums[index])
         constraints.append(row_sum_con)
-        add_constraint_for_vars(vars_to_cons, row, row_sum_con)
+        builder.add_constraint(row_sum_con)
 
     # Add cols
     for col in range(len(vars)):
         cells_in_col = [row[col] for row in vars]
         col_sum_con = LineSumConstraint(scope=cells_in_col, sum=col_sums[col])
         constraints.append(col_sum_con)
-        add_constraint_for_vars(vars_to_cons, cells_in_col, col_sum_con)
+        builder.add_constraint(col_sum_con)
 
     return constraints
 
 
 def generate_water_cons(
-    vars: List[List[Cell]],
-    vars_to_cons: Dict[Cell, List[Constraint]]) -> List[DiagonalConstraint]:
+    builder: CSPBuilder, vars: List[List[Cell]]) -> List[DiagonalConstraint]:
 
     dim = len(vars)
     constraints = []
@@ -543,22 +674,50 @@ def generate_water_cons(
             if bot_left_diag[0] < dim and bot_left_diag[1] >= 0:
                 scope = [coord, bot_left_diag]
                 diag_con = DiagonalConstraint(scope)
-                add_constraint_for_vars(vars_to_cons, scope, diag_con)
+                builder.add_constraint(diag_con)
                 constraints.append(diag_con)
 
             if bot_right_diag[0] < dim and bot_right_diag[1] < dim:
                 scope = [coord, bot_right_diag]
                 diag_con = DiagonalConstraint(scope)
-                add_constraint_for_vars(vars_to_cons, scope, diag_con)
+                builder.add_constraint(diag_con)
                 constraints.append(diag_con)
 
     return constraints
 
 
+def generate_adjacency_cons(
+    builder: CSPBuilder, vars: List[List[Cell]]) -> List[AdjacencyConstraint]:
+
+    dim = len(vars)
+    constraints = []
+
+    for row in range(dim):
+        for col in range(len(vars[row])):
+
+            coord = (row, col)
+            right = (row, col + 1)
+            below = (row + 1, col)
+
+            if right[1] < dim:
+                scope = [coord, right]
+                adj_con = AdjacencyConstraint(scope)
+                builder.add_constraint(adj_con)
+                constraints.append(adj_con)
+
+            if below[0] < dim:
+                scope = [coord, below]
+                adj_con = AdjacencyConstraint(scope)
+                builder.add_constraint(adj_con)
+                constraints.append(adj_con)
+
+    return constraints
+
+
 def generate_ship_cons(
+    builder: CSPBuilder,
     ship_counts: List[int],
-    vars: List[List[Cell]],
-    vars_to_cons: Dict[Cell, List[Constraint]]) -> List[Constraint]:
+    vars: List[List[Cell]]) -> List[Constraint]:
 
     dim = len(vars)
     constraints = []
@@ -576,19 +735,19 @@ def generate_ship_cons(
             if  has_destroyer and PieceType.D_S in fitting_types:
                 scope = [(row, col), (row, col + 1)]
                 ship_con = DestroyerConstraint(scope)
-                add_constraint_for_vars(vars_to_cons, scope, ship_con)
+                builder.add_constraint(ship_con)
                 constraints.append(ship_con)
 
             if has_cruiser and PieceType.C_S in fitting_types:
                 scope = [(row, col), (row, col + 1), (row, col + 2)]
                 ship_con = CruiserConstraint(scope)
-                add_constraint_for_vars(vars_to_cons, scope, ship_con)
+                builder.add_constraint(ship_con)
                 constraints.append(ship_con)
 
             if has_battle_ship and PieceType.B_S in fitting_types:
                 scope = [(row, col), (row, col + 1), (row, col + 2), (row, col + 3)]
                 ship_con = BattleshipConstraint(scope)
-                add_constraint_for_vars(vars_to_cons, scope, ship_con)
+                builder.add_constraint(ship_con)
                 constraints.append(ship_con)
 
             # vertical
@@ -597,38 +756,33 @@ def generate_ship_cons(
             if has_destroyer and PieceType.D_S in fitting_types:
                 scope = [(row, col), (row + 1, col)]
                 ship_con = DestroyerConstraint(scope)
-                add_constraint_for_vars(vars_to_cons, scope, ship_con)
+                builder.add_constraint(ship_con)
                 constraints.append(ship_con)
 
             if has_cruiser and PieceType.C_S in fitting_types:
                 scope = [(row, col), (row + 1, col), (row + 2, col)]
                 ship_con = CruiserConstraint(scope)
-                add_constraint_for_vars(vars_to_cons, scope, ship_con)
+                builder.add_constraint(ship_con)
                 constraints.append(ship_con)
 
             if has_battle_ship and PieceType.B_S in fitting_types:
                 scope = [(row, col), (row + 1, col), (row + 2, col), (row + 3, col)]
                 ship_con = BattleshipConstraint(scope)
-                add_constraint_for_vars(vars_to_cons, scope, ship_con)
+                builder.add_constraint(ship_con)
                 constraints.append(ship_con)
 
     return constraints
 
 
-def generate_unique_cons(
+def generate_ship_identity_cons(
+    builder: CSPBuilder,
     flattened_vars: List[Cell],
-    vars_to_cons: Dict[Cell, List[Constraint]]) -> List[Constraint]:
+    domains: Dict[Cell, List[Piece]]) -> List[Constraint]:
 
-    constraints = []
+    identity_con = ShipIdentityConstraint(flattened_vars, domains)
+    builder.add_constraint(identity_con)
 
-    for i, cell1 in enumerate(flattened_vars):
-        for cell2 in flattened_vars[i + 1:]:
-            scope = [cell1, cell2]
-            unique_con = UniqueConstraint(scope)
-            add_constraint_for_vars(vars_to_cons, scope, unique_con)
-            constraints.append(unique_con)
-
-    return constraints
+    return [identity_con]
 
 
 def get_output_symbol(piece: Piece) -> str:
@@ -656,7 +810,7 @@ def get_output_symbol(piece: Piece) -> str:
 
 
 def format_output(
-    vars: List[List[Cell]], values: Dict[Cell, Piece]) -> Grid:
+    vars: List[List[Cell]], values: Mapping[Cell, Piece]) -> Grid:
 
     output_grid = []
 
@@ -670,51 +824,195 @@ def format_output(
     return output_grid
 
 
-def run_csp(
+def build_model(
     row_sums: List[int],
     col_sums: List[int],
     ship_count: List[int],
     grid: Grid
-    ) -> Tuple[bool, Grid, CSP]:
+    ) -> CSPBuilder:
 
     pieces = generate_ship_pieces(ship_count)
 
     vars = generate_variables(grid)
     domains = generate_domains(grid, pieces)
-    constraints = []
-    vars_to_cons = {}
+    builder = CSPBuilder()
 
     flattened_vars: List[Cell] = []
     for row in vars:
         flattened_vars.extend(row)
 
-    constraints += generate_sum_cons(vars, vars_to_cons, row_sums, col_sums)
-    constraints += generate_water_cons(vars, vars_to_cons)
-    constraints += generate_ship_cons(ship_count, vars, vars_to_cons)
-    constraints += generate_unique_cons(flattened_vars, vars_to_cons)
+    for cell in flattened_vars:
+        builder.add_variable(cell, domains[cell])
+
+    generate_sum_cons(builder, vars, row_sums, col_sums)
+    generate_water_cons(builder, vars)
+    generate_adjacency_cons(builder, vars)
+    generate_ship_cons(builder, ship_count, vars)
+    generate_ship_identity_cons(builder, flattened_vars, domains)
+
+    return builder
 
-    csp = CSP(
-        flattened_vars,
-        domains,
-        constraints,
-        vars_to_cons
+
+def build_csp(
+    row_sums: List[int],
+    col_sums: List[int],
+    ship_count: List[int],
+    grid: Grid,
+    value_ordering: Union[str, ValueOrdering] = "lexical",
+    propagation: str = FORWARD_CHECKING,
+    variable_ordering: Union[str, VariableOrdering] = "mrv",
+    backjumping: bool = False,
+    learning: bool = False,
+    stats: bool = False
+    ) -> CSP:
+
+    return build_model(row_sums, col_sums, ship_count, grid).build(
+        variable_ordering=variable_ordering,
+        value_ordering=value_ordering,
+        propagation=propagation,
+        backjumping=backjumping,
+        learning=learning,
+        stats=stats
     )
 
-    sol_found = csp.satisfy()
+
+def run_csp(
+    row_sums: List[int],
+    col_sums: List[int],
+    ship_count: List[int],
+    grid: Grid,
+    value_ordering: Union[str, ValueOrdering] = "lexical",
+    propagation: str = FORWARD_CHECKING,
+    variable_ordering: Union[str, VariableOrdering] = "mrv",
+    restarts: Optional[str] = None,
+    seed: Optional[int] = None,
+    backjumping: bool = False,
+    learning: bool = False,
+    stats: bool = False,
+    listeners: Optional[List[SearchListener]] = None
+    ) -> Tuple[bool, Grid, CSP]:
+
+    csp = build_csp(
+        row_sums, col_sums, ship_count, grid,
+        value_ordering, propagation, variable_ordering, backjumping, learning, stats
+    )
+    for listener in listeners or []:
+        csp.add_listener(listener)
+
+    if restarts is not None:
+        sol_found = csp.search_with_restarts(restarts, seed)
+    else:
+        sol_found = csp.search() == True
     output_grid: Grid = []
 
     if sol_found:
-        output_grid = format_output(vars, csp.values)
+        output_grid = format_output(generate_variables(grid), csp.assignment())
     else:
         print("No sol found")
 
     return sol_found, output_grid, csp
 
 
-def main(input_filename: str, output_filename: str) -> None:
+def run_parallel(
+    row_sums: List[int],
+    col_sums: List[int],
+    ship_count: List[int],
+    grid: Grid,
+    workers: int,
+    value_ordering: Union[str, ValueOrdering] = "lexical",
+    propagation: str = FORWARD_CHECKING,
+    variable_ordering: Union[str, VariableOrdering] = "mrv",
+    backjumping: bool = False,
+    learning: bool = False
+    ) -> Tuple[bool, Grid]:
+
+    factory = functools.partial(
+        build_csp, row_sums, col_sums, ship_count, grid,
+        value_ordering, propagation, variable_ordering, backjumping, learning
+    )
+    solution = ParallelSolver(factory, workers).solve()
+    output_grid: Grid = []
+
+    if solution is not None:
+        output_grid = format_output(generate_variables(grid), solution)
+    else:
+        print("No sol found")
+
+    return solution is not None, output_grid
+
+
+def run_portfolio(
+    row_sums: List[int],
+    col_sums: List[int],
+    ship_count: List[int],
+    grid: Grid,
+    workers: Optional[int] = None
+    ) -> Tuple[bool, Grid, PortfolioResult]:
+
+    model = build_model(row_sums, col_sums, ship_count, grid)
+    result = PortfolioSolver(model, workers=workers).solve()
+    output_grid: Grid = []
+
+    if result.solution is not None:
+        output_grid = format_output(generate_variables(grid), result.solution)
+    else:
+        print("No sol found")
+
+    return result.solved, output_grid, result
+
+
+def main(
+    input_filename: str,
+    output_filename: str,
+    value_ordering: str = "lexical",
+    seed: Optional[int] = None,
+    propagation: str = FORWARD_CHECKING,
+    variable_ordering: str = "mrv",
+    workers: int = 1,
+    portfolio: bool = False,
+    restarts: Optional[str] = None,
+    backjumping: bool = False,
+    learning: bool = False,
+    stats: bool = False,
+    trace_filename: Optional[str] = None
+    ) -> None:
 
     row_sums, col_sums, ship_count, grid = read_input(input_filename)
-    sol_found, output_grid, _ = run_csp(row_sums, col_sums, ship_count, grid)
+    if portfolio:
+        sol_found, output_grid, result = run_portfolio(
+            row_sums, col_sums, ship_count, grid,
+            workers if workers > 1 else None
+        )
+        print(f"Portfolio winner: {result}")
+    elif workers > 1:
+        sol_found, output_grid = run_parallel(
+            row_sums, col_sums, ship_count, grid, workers,
+            make_value_ordering(value_ordering, seed),
+            propagation,
+            variable_ordering,
+            backjumping,
+            learning
+        )
+    else:
+        trace_file = open(trace_filename, 'w') if trace_filename is not None else None
+        try:
+            sol_found, output_grid, csp = run_csp(
+                row_sums, col_sums, ship_count, grid,
+                make_value_ordering(value_ordering, seed),
+                propagation,
+                variable_ordering,
+                restarts,
+                seed,
+                backjumping,
+                learning,
+                stats,
+                [TraceRecorder(trace_file)] if trace_file is not None else None
+            )
+        finally:
+            if trace_file is not None:
+                trace_file.close()
+        if csp.stats is not None:
+            print(csp.stats)
 
     if sol_found:
         with open(output_filename, 'w') as file:
@@ -727,11 +1025,75 @@ def main(input_filename: str, output_filename: str) -> None:
 
 if __name__ == "__main__":
 
-    if len(sys.argv) != 3:
-        print("Usage: python3 battle.py <input_file> <output_file>")
-        exit()
+    parser = argparse.ArgumentParser(description="Solves a battleship solitaire puzzle")
+    parser.add_argument("input_file")
+    parser.add_argument("output_file")
+    parser.add_argument(
+        "--value-order", choices=list(VALUE_ORDERINGS), default="lexical",
+        help="order in which the pieces a cell can hold are tried"
+    )
+    parser.add_argument(
+        "--seed", type=int, default=None, help="seed for --value-order random"
+    )
+    parser.add_argument(
+        "--propagation", choices=PROPAGATION_LEVELS, default=FORWARD_CHECKING,
+        help="consistency enforced after each assignment"
+    )
+    parser.add_argument(
+        "--variable-order", choices=list(VARIABLE_ORDERINGS), default="mrv",
+        help="heuristic used to pick the next cell to assign"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="number of processes to split the search across"
+    )
+    parser.add_argument(
+        "--portfolio", action="store_true",
+        help="race differently configured searches and keep the first answer, "
+        "ignoring the ordering and propagation flags"
+    )
+    parser.add_argument(
+        "--restarts", choices=list(RESTART_SCHEDULES), default=None,
+        help="restart the search on this failure cutoff schedule, learning "
+        "nogoods from each run and breaking ordering ties with --seed"
+    )
+    parser.add_argument(
+        "--backjump", action="store_true",
+        help="jump back to the deepest decision involved in each conflict"
+    )
+    parser.add_argument(
+        "--learn", action="store_true",
+        help="record the conflicts behind backjumps as nogoods (implies --backjump)"
+    )
+    parser.add_argument(
+        "--stats", action="store_true",
+        help="print search statistics, with time spent per constraint class"
+    )
+    parser.add_argument(
+        "--trace", default=None, metavar="TRACE_FILE",
+        help="record every search event to this JSON lines file, "
+        "to be summarized with tracing.py"
+    )
+    args = parser.parse_args()
+    if (args.stats or args.trace) and (args.workers > 1 or args.portfolio):
+        parser.error("--stats and --trace are only supported by a single sequential search")
+    if args.restarts is not None and (args.workers > 1 or args.portfolio):
+        parser.error("--restarts is only supported by a single sequential search")
+    if (args.backjump or args.learn) and args.portfolio:
+        parser.error("--backjump and --learn are not supported by --portfolio")
 
     main(
-        input_filename=sys.argv[1],
-        output_filename=sys.argv[2]
+        input_filename=args.input_file,
+        output_filename=args.output_file,
+        value_ordering=args.value_order,
+        seed=args.seed,
+        propagation=args.propagation,
+        variable_ordering=args.variable_order,
+        workers=args.workers,
+        portfolio=args.portfolio,
+        restarts=args.restarts,
+        backjumping=args.backjump,
+        learning=args.learn,
+        stats=args.stats,
+        trace_filename=args.trace
     )
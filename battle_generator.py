@@ -0,0 +1,258 @@
+import argparse
+import random
+from typing import List, Optional, Tuple
+
+import battle
+from battle import Cell, Grid
+from csp import GAC
+
+
+# Row sums, column sums, ship counts and hint grid, as read by battle.read_input
+Puzzle = Tuple[List[int], List[int], List[int], Grid]
+
+# Submarines, destroyers, cruisers and battleships of the classic 10x10 game
+CLASSIC_FLEET = [4, 3, 2, 1]
+
+# Symbols of a horizontal or vertical ship of each length, as written by
+# battle.get_output_symbol
+SHIP_SYMBOLS = {
+    (1, False): "S", (1, True): "S",
+    (2, False): "LR", (2, True): "TB",
+    (3, False): "LMR", (3, True): "TMB",
+    (4, False): "LMMR", (4, True): "TMMB",
+}
+
+UNKNOWN = '0'
+WATER = 'W'
+
+
+def default_fleet(dimension: int) -> List[int]:
+    """The classic fleet scaled to the area of a <dimension> square grid"""
+    scale = dimension * dimension / 100
+    fleet = [round(count * scale) for count in CLASSIC_FLEET]
+    # Even the smallest grids get a submarine
+    fleet[0] = max(fleet[0], 1)
+    return fleet
+
+
+def place_fleet(
+    dimension: int,
+    fleet: List[int],
+    rng: random.Random,
+    attempts: int = 1000
+    ) -> Grid:
+    """
+    Solved grid with the ships of <fleet> at random, no two of them touching,
+    not even diagonally. Largest ships are placed first, and the grid is
+    started over whenever a ship no longer fits.
+    """
+    if any(count > 0 and length > dimension for length, count in enumerate(fleet, 1)):
+        raise ValueError(f"Fleet {fleet} has ships longer than the grid")
+
+    for _ in range(attempts):
+        solution = _try_place_fleet(dimension, fleet, rng)
+        if solution is not None:
+            return solution
+
+    raise ValueError(f"Could not fit fleet {fleet} on a {dimension}x{dimension} grid")
+
+
+def _try_place_fleet(dimension: int, fleet: List[int], rng: random.Random) -> Optional[Grid]:
+    solution = [[WATER] * dimension for _ in range(dimension)]
+    # Cells taken by a ship or next to one
+    blocked = [[False] * dimension for _ in range(dimension)]
+
+    for length in range(len(fleet), 0, -1):
+        for _ in range(fleet[length - 1]):
+            positions = []
+            for vertical in ([False] if length == 1 else [False, True]):
+                rows = dimension - length + 1 if vertical else dimension
+                cols = dimension if vertical else dimension - length + 1
+                for row in range(rows):
+                    for col in range(cols):
+                        cells = _ship_cells(row, col, length, vertical)
+                        if not any(blocked[r][c] for r, c in cells):
+                            positions.append((cells, vertical))
+            if len(positions) == 0:
+                return None
+
+            cells, vertical = rng.choice(positions)
+            for (row, col), symbol in zip(cells, SHIP_SYMBOLS[(length, vertical)]):
+                solution[row][col] = symbol
+                for r in range(max(0, row - 1), min(dimension, row + 2)):
+                    for c in range(max(0, col - 1), min(dimension, col + 2)):
+                        blocked[r][c] = True
+
+    return solution
+
+
+def _ship_cells(row: int, col: int, length: int, vertical: bool) -> List[Cell]:
+    if vertical:
+        return [(row + i, col) for i in range(length)]
+    return [(row, col + i) for i in range(length)]
+
+
+def line_sums(solution: Grid) -> Tuple[List[int], List[int]]:
+    """Ship segments in every row and every column of <solution>"""
+    row_sums = [sum(symbol != WATER for symbol in row) for row in solution]
+    col_sums = [sum(symbol != WATER for symbol in col) for col in zip(*solution)]
+    return row_sums, col_sums
+
+
+def reveal_hints(solution: Grid, fraction: float, rng: random.Random) -> Grid:
+    """Grid showing a random <fraction> of the cells of <solution>"""
+    dimension = len(solution)
+    cells = [(row, col) for row in range(dimension) for col in range(dimension)]
+    hints = [[UNKNOWN] * dimension for _ in range(dimension)]
+    for row, col in rng.sample(cells, round(fraction * len(cells))):
+        hints[row][col] = solution[row][col]
+    return hints
+
+
+def has_other_solution(puzzle: Puzzle, solution: Grid, cell: Cell) -> bool:
+    """Whether <puzzle> has a solution showing something else than <solution> at <cell>"""
+    row_sums, col_sums, ship_count, hints = puzzle
+    builder = battle.build_model(row_sums, col_sums, ship_count, hints)
+    row, col = cell
+    domain = [
+        piece for piece in builder.domains[cell]
+        if battle.get_output_symbol(piece) != solution[row][col]
+    ]
+    if len(domain) == 0:
+        return False
+    builder.domains[cell] = domain
+
+    csp = builder.build(variable_ordering="dom/wdeg", propagation=GAC)
+    return csp.search() == True
+
+
+def make_unique(puzzle: Puzzle, solution: Grid, rng: random.Random) -> int:
+    """
+    Reveals hints of <solution> in <puzzle> until it is the only solution,
+    and returns how many were added. Hidden cells are visited in random
+    order, and each one that some other solution fills differently is
+    revealed. Hints only remove solutions, so a cell found to be forced
+    stays forced and is never checked again.
+    """
+    hints = puzzle[3]
+    hidden = [
+        (row, col)
+        for row in range(len(hints)) for col in range(len(hints))
+        if hints[row][col] == UNKNOWN
+    ]
+    rng.shuffle(hidden)
+
+    added = 0
+    for row, col in hidden:
+        if has_other_solution(puzzle, solution, (row, col)):
+            hints[row][col] = solution[row][col]
+            added += 1
+    return added
+
+
+def generate_puzzle(
+    dimension: int,
+    fleet: Optional[List[int]] = None,
+    hint_fraction: float = 0.1,
+    seed: Optional[int] = None,
+    unique: bool = False
+    ) -> Tuple[Puzzle, Grid]:
+    """
+    Random puzzle on a <dimension> square grid and the solution it was made
+    from. The same seed always gives the same puzzle.
+    """
+    if dimension < 1:
+        raise ValueError("The grid needs at least one cell")
+    if not 0 <= hint_fraction <= 1:
+        raise ValueError("The hint fraction must be between 0 and 1")
+    if fleet is None:
+        fleet = default_fleet(dimension)
+
+    rng = random.Random(seed)
+    solution = place_fleet(dimension, fleet, rng)
+    row_sums, col_sums = line_sums(solution)
+    puzzle = (row_sums, col_sums, list(fleet), reveal_hints(solution, hint_fraction, rng))
+    if unique:
+        make_unique(puzzle, solution, rng)
+
+    return puzzle, solution
+
+
+def format_puzzle(puzzle: Puzzle) -> List[str]:
+    """
+    Lines of the battle.py input file for <puzzle>. Numbers are written one
+    digit each, as in the hand-made puzzles, unless any of them needs more.
+    """
+    row_sums, col_sums, ship_count, hints = puzzle
+    separator = "" if all(number <= 9 for number in row_sums + col_sums + ship_count) else " "
+    lines = [
+        separator.join(str(number) for number in numbers)
+        for numbers in (row_sums, col_sums, ship_count)
+    ]
+    for row in hints:
+        lines.append("".join(row))
+    return lines
+
+
+def write_grid(filename: str, lines: List[str]) -> None:
+    with open(filename, 'w') as file:
+        for line in lines:
+            file.write(line + "\n")
+
+
+def main(
+    output_filename: str,
+    dimension: int,
+    fleet: Optional[List[int]] = None,
+    hint_fraction: float = 0.1,
+    seed: Optional[int] = None,
+    unique: bool = False,
+    solution_filename: Optional[str] = None
+    ) -> None:
+
+    puzzle, solution = generate_puzzle(dimension, fleet, hint_fraction, seed, unique)
+    write_grid(output_filename, format_puzzle(puzzle))
+    if solution_filename is not None:
+        write_grid(solution_filename, ["".join(row) for row in solution])
+
+    hints = sum(symbol != UNKNOWN for row in puzzle[3] for symbol in row)
+    print(f"{dimension}x{dimension} puzzle with fleet {puzzle[2]} and {hints} hints")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Generates a battleship solitaire puzzle")
+    parser.add_argument("output_file")
+    parser.add_argument("--size", type=int, default=10, help="width and height of the grid")
+    parser.add_argument(
+        "--fleet", type=int, nargs=4, default=None,
+        metavar=("SUBS", "DESTROYERS", "CRUISERS", "BATTLESHIPS"),
+        help="number of ships of each length, by default the classic "
+        "10x10 fleet scaled to the grid"
+    )
+    parser.add_argument(
+        "--hints", type=float, default=0.1,
+        help="fraction of the cells revealed as hints"
+    )
+    parser.add_argument("--seed", type=int, default=None, help="seed of the random placement")
+    parser.add_argument(
+        "--unique", action="store_true",
+        help="reveal more hints until the puzzle has a single solution"
+    )
+    parser.add_argument(
+        "--solution", default=None, metavar="SOLUTION_FILE",
+        help="also write the solved grid to this file"
+    )
+    args = parser.parse_args()
+    try:
+        main(
+            output_filename=args.output_file,
+            dimension=args.size,
+            fleet=args.fleet,
+            hint_fraction=args.hints,
+            seed=args.seed,
+            unique=args.unique,
+            solution_filename=args.solution
+        )
+    except ValueError as error:
+        parser.error(str(error))
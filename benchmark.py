@@ -0,0 +1,260 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+import battle
+from csp import SearchStats
+from nqueens import NO_QUEEN_INDEX, NQueensSolver
+
+
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, "baseline.json")
+
+# Metrics compared against the baseline, with the relative increase each
+# tolerates by default. Nodes and checks are deterministic, so any increase
+# is a change in the search itself
+DEFAULT_THRESHOLDS = {
+    "seconds": 0.25,
+    "nodes": 0.0,
+    "checks": 0.0,
+    "peak_kib": 0.25,
+}
+
+# Time increases below this are noise and never reported, whatever their
+# relative size. Cases that run for a few tens of milliseconds jitter by
+# more than the time threshold, so their nodes and checks catch regressions
+MIN_SECONDS = 0.05
+
+Metrics = Dict[str, float]
+
+
+class Case:
+    """
+    One benchmark. <run> performs the whole solve once, with statistics
+    collected if asked to, and returns them.
+    """
+
+    def __init__(self, name: str, run: Callable[[bool], Optional[SearchStats]]) -> None:
+        self.name = name
+        self.run = run
+
+
+def nqueens_case(
+    name: str,
+    dimension: int,
+    queens: Optional[Dict[int, int]] = None,
+    count: bool = False,
+    **options: object
+    ) -> Case:
+    """N-Queens with <queens> placed up front, finding one solution or counting all"""
+    starting_queens = [NO_QUEEN_INDEX] * dimension
+    for row, col in (queens or {}).items():
+        starting_queens[row] = col
+
+    def run(stats: bool) -> Optional[SearchStats]:
+        solver = NQueensSolver(dimension, list(starting_queens), stats=stats, **options)  # type: ignore
+        if count:
+            solver.count()
+        else:
+            solver.solve()
+        return solver.stats
+
+    return Case(name, run)
+
+
+def battle_case(name: str, puzzle: str, **options: object) -> Case:
+    """Battleship solitaire puzzle from the benchmark corpus, solved with run_csp"""
+    row_sums, col_sums, ship_count, grid = battle.read_input(os.path.join(BENCHMARK_DIR, puzzle))
+
+    def run(stats: bool) -> Optional[SearchStats]:
+        _, _, csp = battle.run_csp(
+            row_sums, col_sums, ship_count, grid, stats=stats, **options  # type: ignore
+        )
+        return csp.stats
+
+    return Case(name, run)
+
+
+CASES = [
+    nqueens_case("nqueens-8", 8),
+    nqueens_case("nqueens-12", 12),
+    nqueens_case("nqueens-16", 16),
+    nqueens_case("nqueens-32-mrv", 32, variable_ordering="mrv"),
+    nqueens_case("nqueens-12-start", 12, {0: 5, 6: 0}),
+    nqueens_case("nqueens-16-start", 16, {0: 1, 8: 6, 15: 11}),
+    nqueens_case("nqueens-8-count", 8, count=True),
+    nqueens_case("nqueens-8-count-pairwise", 8, count=True, encoding="pairwise"),
+    nqueens_case("nqueens-9-count-symmetry", 9, count=True, break_symmetry=True),
+    battle_case("battle-4x4-fc", "battle_4x4.txt", propagation="fc"),
+    battle_case("battle-4x4-hint-gac", "battle_4x4_hint.txt", propagation="gac"),
+    battle_case("battle-6x6-fc", "battle_6x6.txt", propagation="fc"),
+    battle_case("battle-6x6-gac", "battle_6x6.txt", propagation="gac"),
+    battle_case("battle-6x6-hint-fc", "battle_6x6_hint.txt", propagation="fc"),
+    battle_case("battle-6x6-hint-gac", "battle_6x6_hint.txt", propagation="gac"),
+    battle_case(
+        "battle-8x8-hint-restarts", "battle_8x8_hint.txt",
+        variable_ordering="dom/wdeg", restarts="luby", seed=1
+    ),
+]
+
+
+def measure(case: Case, repeat: int) -> Metrics:
+    """
+    Best wall time of <repeat> plain runs, then nodes, checks and peak
+    memory from one more run with statistics and tracemalloc, which would
+    otherwise skew the timings
+    """
+    # As in timeit, the collector is kept out of the timings, and garbage
+    # left by earlier runs is cleared so that every run starts alike
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            case.run(False)
+            times.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        stats = case.run(True)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "seconds": round(min(times), 4),
+        "nodes": stats.nodes if stats is not None else 0,
+        "checks": stats.total_checks if stats is not None else 0,
+        "peak_kib": peak // 1024,
+    }
+
+
+def compare(
+    results: Dict[str, Metrics],
+    baseline: Dict[str, Metrics],
+    thresholds: Dict[str, float]
+    ) -> List[str]:
+    """Descriptions of every metric that grew past its threshold"""
+    regressions = []
+    for name, metrics in results.items():
+        if name not in baseline:
+            continue
+        for metric, threshold in thresholds.items():
+            old = baseline[name].get(metric)
+            new = metrics[metric]
+            if old is None or new <= old * (1 + threshold):
+                continue
+            if metric == "seconds" and new - old < MIN_SECONDS:
+                continue
+            change = f"+{(new - old) / old:.0%}" if old > 0 else "new"
+            regressions.append(f"{name}: {metric} {old} -> {new} ({change})")
+    return regressions
+
+
+def print_results(results: Dict[str, Metrics], baseline: Dict[str, Metrics]) -> None:
+    width = max(len(name) for name in results)
+    print(f"{'case':<{width}}  {'seconds':>9}  {'nodes':>8}  {'checks':>10}  {'peak KiB':>9}  vs baseline")
+    for name, metrics in results.items():
+        line = (
+            f"{name:<{width}}  {metrics['seconds']:>9.4f}  {metrics['nodes']:>8}  "
+            f"{metrics['checks']:>10}  {metrics['peak_kib']:>9}"
+        )
+        old = baseline.get(name)
+        if old is not None and old["seconds"] > 0:
+            line += f"  {(metrics['seconds'] - old['seconds']) / old['seconds']:+.0%} time"
+        print(line, flush=True)
+
+
+def main(
+    output_filename: Optional[str],
+    baseline_filename: str,
+    save_baseline: bool,
+    repeat: int,
+    only: Optional[str],
+    thresholds: Dict[str, float]
+    ) -> int:
+
+    baseline: Dict[str, Metrics] = {}
+    if not save_baseline and os.path.exists(baseline_filename):
+        with open(baseline_filename) as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+
+    results: Dict[str, Metrics] = {}
+    for case in CASES:
+        if only is not None and only not in case.name:
+            continue
+        results[case.name] = measure(case, repeat)
+    if len(results) == 0:
+        print(f"No benchmark matches '{only}'")
+        return 1
+    print_results(results, baseline)
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "repeat": repeat,
+        "results": results,
+    }
+    if output_filename is not None:
+        with open(output_filename, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+    if save_baseline:
+        with open(baseline_filename, 'w') as baseline_file:
+            json.dump(report, baseline_file, indent=2)
+        print(f"Baseline saved to {baseline_filename}")
+        return 0
+
+    regressions = compare(results, baseline, thresholds)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if len(regressions) > 0 else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the N-Queens and battleship solvers against a baseline"
+    )
+    parser.add_argument(
+        "--output", default=None, metavar="RESULTS_FILE",
+        help="write the results to this JSON file"
+    )
+    parser.add_argument(
+        "--baseline", default=DEFAULT_BASELINE, metavar="BASELINE_FILE",
+        help="JSON results to compare against"
+    )
+    parser.add_argument(
+        "--save-baseline", action="store_true",
+        help="store the results as the new baseline instead of comparing"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3,
+        help="timed runs per benchmark, of which the fastest counts"
+    )
+    parser.add_argument(
+        "--only", default=None, help="only run benchmarks whose name contains this"
+    )
+    for metric, threshold in DEFAULT_THRESHOLDS.items():
+        parser.add_argument(
+            f"--{metric.replace('_', '-')}-threshold", type=float, default=threshold,
+            dest=f"{metric}_threshold",
+            help=f"relative increase in {metric} reported as a regression"
+        )
+    args = parser.parse_args()
+    sys.exit(main(
+        args.output,
+        args.baseline,
+        args.save_baseline,
+        args.repeat,
+        args.only,
+        {metric: getattr(args, f"{metric}_threshold") for metric in DEFAULT_THRESHOLDS}
+    ))
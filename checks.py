@@ -0,0 +1,693 @@
+import argparse
+import functools
+import itertools
+import os
+import random
+import sys
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+import battle
+from benchmark import BENCHMARK_DIR
+from csp import (
+    ARC_QUEUE, CONSTRAINT_QUEUE, CSP, FORWARD_CHECKING, GAC, NO_PROPAGATION,
+    AllDifferent, Constraint, GlobalConstraint, TableConstraint
+)
+from csp_builder import CSPBuilder
+from domains import BITSET, SPARSE_SET, DomainStore
+from heuristics import make_value_ordering
+from nqueens import BOARD_SYMMETRIES, ENCODINGS, NO_QUEEN_INDEX, PAIRWISE, NQueensSolver
+from parallel import ParallelSolver
+
+
+# Known number of N-Queens solutions, and of solutions distinct under
+# rotation and reflection
+NQUEENS_COUNTS = {4: 2, 5: 10, 6: 4, 7: 40, 8: 92}
+NQUEENS_FUNDAMENTAL = {4: 1, 5: 2, 6: 1, 7: 6, 8: 12}
+
+# Propagation levels, each with the queue it runs on. The queue only
+# matters to GAC, so it is varied there alone
+PROPAGATIONS = [
+    (NO_PROPAGATION, ARC_QUEUE),
+    (FORWARD_CHECKING, ARC_QUEUE),
+    (GAC, ARC_QUEUE),
+    (GAC, CONSTRAINT_QUEUE),
+]
+
+# Chronological backtracking, backjumping, and backjumping with learning
+CONFLICTS = [(False, False), (True, False), (False, True)]
+
+# Variable ordering, value ordering and seed
+ORDERINGS = [
+    ("input", "lexical", None),
+    ("mrv", "lcv", None),
+    ("dom/deg", "lexical", None),
+    ("dom/wdeg", "random", 1),
+]
+
+# Without propagation, global constraints are only checked once their whole
+# scope is assigned, so the search enumerates every full assignment
+NO_PROPAGATION_MAX_CELLS = 6
+
+Configuration = Dict[str, object]
+
+
+def configurations(propagations: List[Tuple[str, str]] = PROPAGATIONS) -> Iterator[Configuration]:
+    """Every combination of propagation, conflict handling and ordering"""
+    for (propagation, queue), (backjumping, learning), (variable, value, seed) in \
+        itertools.product(propagations, CONFLICTS, ORDERINGS):
+        yield {
+            "propagation": propagation,
+            "queue": queue,
+            "backjumping": backjumping,
+            "learning": learning,
+            "variable_ordering": variable,
+            "value_ordering": (value, seed),
+        }
+
+
+def build(model: CSPBuilder, configuration: Configuration) -> CSP:
+    options = dict(configuration)
+    value, seed = options.pop("value_ordering")  # type: ignore
+    return model.build(value_ordering=make_value_ordering(value, seed), **options)  # type: ignore
+
+
+def describe(configuration: Configuration) -> str:
+    value, seed = configuration["value_ordering"]  # type: ignore
+    name = f"{configuration['propagation']}/{configuration['queue']}/" \
+        f"{configuration['variable_ordering']}/{value}"
+    if seed is not None:
+        name += f"/seed={seed}"
+    if configuration["learning"]:
+        name += "/learn"
+    elif configuration["backjumping"]:
+        name += "/backjump"
+    return name
+
+
+def violated(constraints: List[Constraint], solution: Dict) -> Optional[Constraint]:
+    """The first of <constraints> that <solution> does not satisfy, if any"""
+    for constraint in constraints:
+        if not constraint.is_satisfied(solution):
+            return constraint
+    return None
+
+
+def check_alldifferent(instances: int = 3000, seed: int = 0) -> List[str]:
+    """
+    Filtering of AllDifferent against brute-force enumeration on random small
+    instances: GAC must prune exactly the values that are in no solution, and
+    elimination only values that are in none
+    """
+    rng = random.Random(seed)
+    failures = []
+
+    for instance in range(instances):
+        size = rng.randint(2, 5)
+        scope = list(range(size))
+        domains = {
+            var: sorted(rng.sample(range(6), rng.randint(1, 4))) for var in scope
+        }
+        supported: Set[Tuple[int, int]] = set()
+        for values in itertools.product(*(domains[var] for var in scope)):
+            if len(set(values)) == size:
+                supported.update(zip(scope, values))
+        unsupported = {
+            (var, value) for var in scope for value in domains[var]
+        } - supported
+        feasible = len(supported) > 0
+
+        for mode in (AllDifferent.GAC, AllDifferent.ELIMINATION):
+            removals = AllDifferent(scope, mode).propagate(DomainStore(domains), None)
+            if removals is None:
+                if feasible:
+                    failures.append(f"{mode} failed on satisfiable {domains}")
+                continue
+            removed = set(removals)
+            if not removed <= unsupported:
+                failures.append(f"{mode} pruned supported values {removed - unsupported} of {domains}")
+            elif mode == AllDifferent.GAC and feasible and removed != unsupported:
+                failures.append(f"{mode} kept unsupported values {unsupported - removed} of {domains}")
+            elif mode == AllDifferent.GAC and not feasible:
+                failures.append(f"{mode} did not fail on unsatisfiable {domains}")
+
+    return failures
+
+
+def check_domains(instances: int = 500, seed: int = 0) -> List[str]:
+    """
+    Bitset and sparse-set domains against plain sets under random removals,
+    bulk removals, intersections and backtracks, with their min and max
+    """
+    rng = random.Random(seed)
+    failures = []
+
+    for instance in range(instances):
+        values = sorted(rng.sample(range(-3, 12), rng.randint(1, 10)))
+        stores = {
+            backend: DomainStore({0: values}, {0: backend}) for backend in (BITSET, SPARSE_SET)
+        }
+        expected = [set(values)]
+        for depth in range(rng.randint(1, 6)):
+            for store in stores.values():
+                store.mark(depth)
+            current = set(expected[-1])
+            picked = rng.sample(range(-5, 14), rng.randint(0, 6))
+            operation = rng.choice(["remove", "remove_all", "restrict"])
+            if operation == "remove" and len(current) > 0:
+                # Only live values may be removed one at a time
+                value = rng.choice(sorted(current))
+                current.discard(value)
+                for store in stores.values():
+                    store.remove(0, value)
+                # A bitset ignores values it no longer holds
+                stores[BITSET].remove(0, value)
+            elif operation == "restrict":
+                current &= set(picked)
+                for store in stores.values():
+                    store.restrict(0, picked)
+            else:
+                current -= set(picked)
+                for store in stores.values():
+                    store.remove_all(0, picked)
+            expected.append(current)
+
+        while True:
+            current = expected[-1]
+            for backend, store in stores.items():
+                label = f"{backend} {values} at depth {len(expected) - 1}"
+                if set(store[0]) != current or store.size(0) != len(current):
+                    failures.append(f"{label}: {sorted(store[0])}, expected {sorted(current)}")
+                elif len(current) > 0 and \
+                    (store.min(0), store.max(0)) != (min(current), max(current)):
+                    failures.append(f"{label}: wrong min or max")
+            if len(expected) == 1:
+                break
+            expected.pop()
+            for store in stores.values():
+                store.restore(len(expected) - 1)
+
+    return failures
+
+
+def check_nqueens(max_dimension: int = 8) -> List[str]:
+    """
+    Number of N-Queens solutions, and that each satisfies every constraint,
+    for every encoding under every search configuration
+    """
+    failures = []
+
+    for dimension in range(4, max_dimension + 1):
+        for encoding in ENCODINGS:
+            for configuration in configurations():
+                if configuration["propagation"] == NO_PROPAGATION and \
+                    encoding != PAIRWISE and dimension > NO_PROPAGATION_MAX_CELLS:
+                    continue
+                model = NQueensSolver(dimension, [NO_QUEEN_INDEX] * dimension, encoding).model()
+                label = f"{dimension}-queens {encoding} {describe(configuration)}"
+                failures += _check_count(
+                    build(model, configuration), model.constraints,
+                    NQUEENS_COUNTS[dimension], label
+                )
+
+    # Restarts find one solution, with nogoods learned from the runs cut off
+    for dimension in range(4, max_dimension + 1):
+        model = NQueensSolver(dimension, [NO_QUEEN_INDEX] * dimension).model()
+        csp = model.build(variable_ordering="dom/wdeg")
+        if not csp.search_with_restarts("luby", seed=dimension):
+            failures.append(f"{dimension}-queens restarts found no solution")
+        elif violated(model.constraints, csp.assignment()) is not None:
+            failures.append(f"{dimension}-queens restarts found an invalid solution")
+
+    return failures
+
+
+def _check_count(csp: CSP, constraints: List[Constraint], expected: int, label: str) -> List[str]:
+    found = 0
+    for solution in csp.solutions():
+        found += 1
+        constraint = violated(constraints, solution)
+        if constraint is not None:
+            return [f"{label}: solution {dict(solution)} violates {constraint!r}"]
+    if found != expected:
+        return [f"{label}: {found} solutions, expected {expected}"]
+    return []
+
+
+def _table_supports(
+    table: TableConstraint,
+    domains: DomainStore
+    ) -> Set[Tuple[object, object]]:
+    supported: Set[Tuple[object, object]] = set()
+    for row in table.tuples:
+        if all(domains.contains(var, value) for var, value in zip(table.scope, row)):
+            supported.update(zip(table.scope, row))
+    return supported
+
+
+def check_symmetry(instances: int = 300, seed: int = 0) -> List[str]:
+    """
+    Symmetry breaking against plain search: the same solutions and count on
+    empty boards and random starting queens, some of them symmetric, and
+    the known number of canonical solutions on empty boards
+    """
+    rng = random.Random(seed)
+    failures = []
+
+    cases = [[NO_QUEEN_INDEX] * dimension for dimension in NQUEENS_COUNTS]
+    for instance in range(instances):
+        dimension = rng.randint(4, 8)
+        queens = [NO_QUEEN_INDEX] * dimension
+        for row in rng.sample(range(dimension), rng.randint(1, 3)):
+            queens[row] = rng.randrange(dimension)
+        # Adding the images of the queens makes the symmetry one that can be
+        # broken, unless two of them end up in the same row
+        if rng.random() < 0.5:
+            symmetry = rng.choice(BOARD_SYMMETRIES[1:])
+            for row, col in list(enumerate(queens)):
+                if col != NO_QUEEN_INDEX:
+                    image_row, image_col = symmetry(dimension, row, col)
+                    queens[image_row] = image_col
+        cases.append(queens)
+
+    for queens in cases:
+        dimension = len(queens)
+        encoding = rng.choice(ENCODINGS)
+        label = f"{dimension}-queens {encoding} starting at {queens}"
+        plain = NQueensSolver(dimension, queens, encoding)
+        broken = NQueensSolver(dimension, queens, encoding, break_symmetry=True)
+
+        expected = {tuple(sorted(solution.items())) for solution in plain.solutions()}
+        found = [tuple(sorted(solution.items())) for solution in broken.solutions()]
+        if len(found) != len(set(found)):
+            failures.append(f"{label}: solutions repeated across orbits")
+        elif set(found) != expected:
+            failures.append(f"{label}: {len(found)} solutions, expected {len(expected)}")
+        elif broken.count() != len(expected):
+            failures.append(f"{label}: counted {broken.count()}, expected {len(expected)}")
+
+        if all(col == NO_QUEEN_INDEX for col in queens):
+            canonical = sum(1 for _ in broken.canonical_solutions())
+            if canonical != NQUEENS_FUNDAMENTAL[dimension]:
+                failures.append(
+                    f"{label}: {canonical} canonical solutions, "
+                    f"expected {NQUEENS_FUNDAMENTAL[dimension]}"
+                )
+
+    return failures
+
+
+def _check_table_filtering(
+    table: TableConstraint,
+    domains: DomainStore,
+    changed: Optional[object]
+    ) -> Optional[str]:
+    supported = _table_supports(table, domains)
+    removals = table.propagate(domains, changed)
+    if removals is None:
+        return None if len(supported) == 0 else "failed on a satisfiable table"
+    if len(supported) == 0:
+        return "did not fail on an unsatisfiable table"
+    unsupported = {
+        (var, value) for var in table.scope for value in domains[var]
+    } - supported
+    if set(removals) != unsupported:
+        return f"removed {sorted(removals)}, expected {sorted(unsupported)}"
+    return None
+
+
+def tabulated(model: CSPBuilder) -> CSPBuilder:
+    """Copy of <model> with every constraint that is not global as a table"""
+    table_model = CSPBuilder()
+    for var in model.variables:
+        table_model.add_variable(var, model.domains[var], model.backends[var])
+    for constraint in model.constraints:
+        table_model.add_constraint(
+            constraint, as_table=not isinstance(constraint, GlobalConstraint)
+        )
+    return table_model
+
+
+def check_table(instances: int = 2000, seed: int = 0) -> List[str]:
+    """
+    Compact-Table filtering against the tuples still valid on random small
+    tables, before and after values are removed and put back. Then N-Queens
+    with its constraints tabulated under every search configuration, with
+    restarts, and two CSPs built from one model searched in turns, as they
+    share its tables.
+    """
+    rng = random.Random(seed)
+    failures = []
+
+    for instance in range(instances):
+        scope = list(range(rng.randint(1, 3)))
+        tuples = list({
+            tuple(rng.randrange(4) for _ in scope) for _ in range(rng.randint(0, 12))
+        })
+        domains = DomainStore({
+            var: sorted(rng.sample(range(4), rng.randint(1, 4))) for var in scope
+        })
+        table = TableConstraint(scope, tuples)
+        label = f"table {tuples} on {domains.snapshot()}"
+
+        failure = _check_table_filtering(table, domains, None)
+        if failure is None and table.propagate(domains, None) is not None:
+            domains.mark(0)
+            var = rng.choice(scope)
+            for value in rng.sample(domains[var], rng.randint(0, domains.size(var) - 1)):
+                domains.remove(var, value)
+            failure = _check_table_filtering(table, domains, var)
+            if failure is None:
+                domains.restore(0)
+                failure = _check_table_filtering(table, domains, var)
+        if failure is not None:
+            failures.append(f"{label}: {failure}")
+
+    for dimension in NQUEENS_COUNTS:
+        model = NQueensSolver(dimension, [NO_QUEEN_INDEX] * dimension).model()
+        table_model = tabulated(model)
+        for configuration in configurations():
+            label = f"{dimension}-queens tables {describe(configuration)}"
+            failures += _check_count(
+                build(table_model, configuration), model.constraints,
+                NQUEENS_COUNTS[dimension], label
+            )
+
+        csp = table_model.build(variable_ordering="dom/wdeg")
+        if not csp.search_with_restarts("luby", seed=dimension):
+            failures.append(f"{dimension}-queens tables restarts found no solution")
+        elif violated(model.constraints, csp.assignment()) is not None:
+            failures.append(f"{dimension}-queens tables restarts found an invalid solution")
+
+        # Each node of one CSP is visited between two of the other
+        first, second = table_model.build(), table_model.build()
+        counts = [0, 0]
+        running = [True, True]
+        while any(running):
+            for index, csp in enumerate((first, second)):
+                if not running[index]:
+                    continue
+                result = csp.search(node_limit=1)
+                if result is None:
+                    continue
+                if result:
+                    counts[index] += 1
+                    if violated(model.constraints, csp.assignment()) is not None:
+                        failures.append(f"{dimension}-queens shared tables: invalid solution")
+                        running[index] = False
+                else:
+                    running[index] = False
+        if counts != [NQUEENS_COUNTS[dimension]] * 2:
+            failures.append(
+                f"{dimension}-queens shared tables: {counts} solutions, "
+                f"expected {NQUEENS_COUNTS[dimension]} each"
+            )
+
+    return failures
+
+
+def memoized(model: CSPBuilder, cache: Optional[int]) -> CSPBuilder:
+    """Copy of <model> whose pure constraints memoize up to <cache> results"""
+    memo_model = CSPBuilder()
+    for var in model.variables:
+        memo_model.add_variable(var, model.domains[var], model.backends[var])
+    for constraint in model.constraints:
+        memo_model.add_constraint(constraint, cache=cache)
+    return memo_model
+
+
+# Memo cache sizes: a single result, a few, and more than any model here needs
+CACHE_SIZES = [1, 8, 100000]
+
+
+def check_memo() -> List[str]:
+    """
+    Solution counts of N-Queens and of a battleship puzzle with memoized
+    constraints, at every cache size and under every propagation level and
+    conflict handling, against the same models without a cache
+    """
+    failures = []
+
+    # Like check_battle, the puzzle is only counted with propagation
+    models: List[Tuple[str, CSPBuilder, List[Tuple[str, str]]]] = []
+    for dimension in (6, 8):
+        model = NQueensSolver(dimension, [NO_QUEEN_INDEX] * dimension, PAIRWISE).model()
+        models.append((f"{dimension}-queens", model, PROPAGATIONS))
+    row_sums, col_sums, ship_count, hints = battle.read_input(
+        os.path.join(BENCHMARK_DIR, BATTLE_PUZZLES[1])
+    )
+    model = battle.build_model(row_sums, col_sums, ship_count, hints)
+    models.append((BATTLE_PUZZLES[1], model, PROPAGATIONS[1:]))
+
+    for name, model, propagations in models:
+        for (propagation, queue), (backjumping, learning) in \
+            itertools.product(propagations, CONFLICTS):
+            options = {
+                "propagation": propagation, "queue": queue,
+                "backjumping": backjumping, "learning": learning,
+                "variable_ordering": "mrv",
+            }
+            expected = memoized(model, None).build(**options).count()  # type: ignore
+            for size in CACHE_SIZES:
+                csp = memoized(model, size).build(stats=True, **options)  # type: ignore
+                found = csp.count()
+                label = f"{name} cache={size} {propagation}/{queue}" + \
+                    ("/learn" if learning else "/backjump" if backjumping else "")
+                if found != expected:
+                    failures.append(f"{label}: {found} solutions, expected {expected}")
+                elif csp.stats.cache_hits + csp.stats.cache_misses == 0:
+                    failures.append(f"{label}: the cache was never used")
+
+    return failures
+
+
+# Battleship puzzles small enough to enumerate by brute force
+BATTLE_PUZZLES = ["battle_4x4.txt", "battle_4x4_hint.txt", "battle_6x6_hint.txt"]
+
+# Symbols of a horizontal and a vertical ship of each length
+SHIP_SYMBOLS = {1: ("S", "S"), 2: ("LR", "TB"), 3: ("LMR", "TMB"), 4: ("LMMR", "TMMB")}
+
+Grid = Tuple[str, ...]
+
+
+def enumerate_battle_grids(
+    row_sums: List[int],
+    col_sums: List[int],
+    ship_count: List[int],
+    hints: battle.Grid
+    ) -> Set[Grid]:
+    """
+    Every solved grid of a puzzle, found by placing the ships directly
+    rather than through the CSP model. Ships of the same length are placed
+    in increasing position order, so each grid is found once.
+    """
+    dimension = len(hints)
+    ships = [
+        length for length in range(len(ship_count), 0, -1)
+        for _ in range(ship_count[length - 1])
+    ]
+    placements: Dict[int, List[List[Tuple[int, int, str]]]] = {}
+    for length in set(ships):
+        placements[length] = []
+        for vertical in ([False] if length == 1 else [False, True]):
+            for row in range(dimension - (length - 1 if vertical else 0)):
+                for col in range(dimension - (0 if vertical else length - 1)):
+                    placements[length].append([
+                        (row + i if vertical else row, col if vertical else col + i,
+                            SHIP_SYMBOLS[length][vertical][i])
+                        for i in range(length)
+                    ])
+
+    grid = [["W"] * dimension for _ in range(dimension)]
+    rows = [0] * dimension
+    cols = [0] * dimension
+    grids: Set[Grid] = set()
+
+    def fits(cells: List[Tuple[int, int, str]]) -> bool:
+        for row, col, symbol in cells:
+            if hints[row][col] not in ("0", symbol):
+                return False
+            if rows[row] >= row_sums[row] or cols[col] >= col_sums[col]:
+                return False
+            for r in range(max(0, row - 1), min(dimension, row + 2)):
+                for c in range(max(0, col - 1), min(dimension, col + 2)):
+                    if grid[r][c] != "W":
+                        return False
+        return True
+
+    def place(ship: int, first: int) -> None:
+        if ship == len(ships):
+            solved = tuple("".join(row) for row in grid)
+            if rows == row_sums and cols == col_sums and all(
+                hints[r][c] in ("0", solved[r][c])
+                for r in range(dimension) for c in range(dimension)
+            ):
+                grids.add(solved)
+            return
+
+        length = ships[ship]
+        for index in range(first, len(placements[length])):
+            cells = placements[length][index]
+            if not fits(cells):
+                continue
+            for row, col, symbol in cells:
+                grid[row][col] = symbol
+                rows[row] += 1
+                cols[col] += 1
+            same = ship + 1 < len(ships) and ships[ship + 1] == length
+            place(ship + 1, index + 1 if same else 0)
+            for row, col, _ in cells:
+                grid[row][col] = "W"
+                rows[row] -= 1
+                cols[col] -= 1
+
+    place(0, 0)
+    return grids
+
+
+def check_battle() -> List[str]:
+    """
+    Solved grids of small battleship puzzles under every search configuration
+    that propagates, against brute-force enumeration. The model tells apart
+    ships of the same length, so several of its solutions can share a grid.
+    """
+    failures = []
+
+    for puzzle in BATTLE_PUZZLES:
+        row_sums, col_sums, ship_count, hints = battle.read_input(
+            os.path.join(BENCHMARK_DIR, puzzle)
+        )
+        expected = enumerate_battle_grids(row_sums, col_sums, ship_count, hints)
+        variables = battle.generate_variables(hints)
+
+        for configuration in configurations(PROPAGATIONS[1:]):
+            model = battle.build_model(row_sums, col_sums, ship_count, hints)
+            csp = build(model, configuration)
+            label = f"{puzzle} {describe(configuration)}"
+            grids = set()
+            for solution in csp.solutions():
+                constraint = violated(model.constraints, solution)
+                if constraint is not None:
+                    failures.append(f"{label}: solution violates {constraint!r}")
+                    break
+                grids.add(tuple(
+                    "".join(row) for row in battle.format_output(variables, solution)
+                ))
+            if grids != expected:
+                failures.append(
+                    f"{label}: {len(grids)} grids, expected {len(expected)}"
+                )
+
+    return failures
+
+
+def split_counts(factory: Callable[[], CSP]) -> Tuple[int, int]:
+    """
+    Solutions found by a search that splits off its untried values at every
+    node, counting those of each split-off state in a fresh CSP, and the
+    number of states split off. Raises if a state cannot be restored.
+    """
+    donor = factory()
+    states = []
+    found = 0
+    while True:
+        result = donor.search(node_limit=1)
+        if result is None:
+            stolen = donor.split_search()
+            if stolen is not None:
+                states.append(stolen)
+        elif result:
+            found += 1
+        else:
+            break
+
+    for state in states:
+        csp = factory()
+        csp.restore_search(state)
+        found += csp.count()
+    return found, len(states)
+
+
+def check_split() -> List[str]:
+    """
+    Work splitting of the parallel search: every split-off state restores
+    without error, even when its first value fails, and the solutions of
+    the donor and of every split-off state add up to the sequential count
+    """
+    failures = []
+
+    cases: List[Tuple[str, Callable[[], CSP], int]] = []
+    for dimension in (6, 8):
+        for encoding in ENCODINGS:
+            solver = NQueensSolver(dimension, [NO_QUEEN_INDEX] * dimension, encoding)
+            cases.append((f"{dimension}-queens {encoding}", solver.build, NQUEENS_COUNTS[dimension]))
+    for puzzle in BATTLE_PUZZLES[:2]:
+        row_sums, col_sums, ship_count, hints = battle.read_input(
+            os.path.join(BENCHMARK_DIR, puzzle)
+        )
+        model = battle.build_model(row_sums, col_sums, ship_count, hints)
+        # Workers of battle.py --workers may backjump and learn
+        for propagation in (FORWARD_CHECKING, GAC):
+            for backjumping, learning in CONFLICTS:
+                factory = functools.partial(
+                    model.build, variable_ordering="mrv", propagation=propagation,
+                    backjumping=backjumping, learning=learning
+                )
+                label = f"{puzzle} {propagation}" + \
+                    ("/learn" if learning else "/backjump" if backjumping else "")
+                cases.append((label, factory, factory().count()))
+
+    for label, factory, expected in cases:
+        try:
+            found, splits = split_counts(factory)
+        except ValueError as error:
+            failures.append(f"{label}: {error}")
+            continue
+        if found != expected:
+            failures.append(f"{label}: {found} solutions over {splits} splits, expected {expected}")
+
+    # A small node budget makes the workers split often
+    solver = NQueensSolver(8, [NO_QUEEN_INDEX] * 8)
+    found = ParallelSolver(solver.build, workers=2, node_budget=4).count()
+    if found != NQUEENS_COUNTS[8]:
+        failures.append(f"8-queens on 2 workers: {found} solutions, expected {NQUEENS_COUNTS[8]}")
+
+    return failures
+
+
+CHECKS: Dict[str, Callable[[], List[str]]] = {
+    "alldifferent": check_alldifferent,
+    "domains": check_domains,
+    "nqueens": check_nqueens,
+    "symmetry": check_symmetry,
+    "table": check_table,
+    "battle": check_battle,
+    "split": check_split,
+    "memo": check_memo,
+}
+
+
+def main(only: Optional[str]) -> int:
+    failed = 0
+    for name, check in CHECKS.items():
+        if only is not None and only not in name:
+            continue
+        start = time.perf_counter()
+        failures = check()
+        for failure in failures:
+            print(f"FAIL {name}: {failure}")
+        status = "ok" if len(failures) == 0 else f"{len(failures)} failures"
+        print(f"{name}: {status} ({time.perf_counter() - start:.1f}s)", flush=True)
+        failed += len(failures)
+    return 1 if failed > 0 else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Cross-checks the solver against known counts and brute force"
+    )
+    parser.add_argument(
+        "--only", default=None, help="only run checks whose name contains this"
+    )
+    args = parser.parse_args()
+    sys.exit(main(args.only))
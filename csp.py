@@ -1,10 +1,24 @@
-from typing import Dict, List, Tuple, Union
+from typing import (
+    Any, DefaultDict, Deque, Dict, Hashable, Iterator, List, Mapping, Optional, Set,
+    Tuple, Union
+)
+import itertools
+import random
+import time
 from abc import ABC, abstractmethod
-import copy
+from collections import OrderedDict, defaultdict, deque
+from types import MappingProxyType
 
+from domains import DomainStore
+from heuristics import (
+    ValueOrdering, VariableOrdering, VariableQueue, make_value_ordering,
+    make_variable_ordering
+)
+from restarts import RestartSchedule, make_restart_schedule
 
-Value = int
-Variable = int
+
+Value = Any
+Variable = Hashable
 Assignment = Dict[Variable, Value]
 Domain = Dict[Variable, List[Value]]
 
@@ -12,6 +26,9 @@ Domain = Dict[Variable, List[Value]]
 class Constraint(ABC):
 
     scope: List[Variable] = []
+    # Whether is_satisfied depends on nothing but the assignment it is given.
+    # Results of impure constraints are never cached or reused as residues
+    pure: bool = True
 
     def  __init__(self, scope: List[Variable]) -> None:
         self.scope = scope
@@ -20,6 +37,883 @@ class Constraint(ABC):
     def is_satisfied(self, assignment: Assignment) -> bool:
         pass
 
+    @property
+    def kind(self) -> str:
+        """Name search statistics report the constraint under"""
+        return type(self).__name__
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}: {self.scope}"
+
+    def filter_supported(
+        self,
+        variable: Variable,
+        values: List[Value],
+        assignment: Assignment
+        ) -> List[bool]:
+        """
+        Whether the constraint holds for each of <values> of <variable>, with
+        the rest of the scope fixed as in <assignment>. Constraints can
+        override it to check all the values at once
+        """
+        assignment = dict(assignment)
+        supported = []
+        for value in values:
+            assignment[variable] = value
+            supported.append(self.is_satisfied(assignment))
+        return supported
+
+
+class MemoizedConstraint(Constraint):
+    """
+    Pure constraint whose is_satisfied results are cached, keyed by the values
+    of its scope in order. Once <size> results are held, the least recently
+    used one is evicted. Statistics and traces report it as the constraint
+    it wraps.
+    """
+
+    def __init__(self, constraint: Constraint, size: int) -> None:
+        if not constraint.pure:
+            raise ValueError(f"Cannot memoize impure constraint {constraint}")
+        if size < 1:
+            raise ValueError("Memo cache size must be at least 1")
+        super().__init__(constraint.scope)
+        self.constraint = constraint
+        # A constraint that checks values in bulk is faster than the cache
+        self.bulk = type(constraint).filter_supported is not Constraint.filter_supported
+        self.size = size
+        self.cache: OrderedDict[Tuple[Value, ...], bool] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def is_satisfied(self, assignment: Assignment) -> bool:
+        key = tuple(assignment[var] for var in self.scope)
+        cache = self.cache
+        result = cache.get(key)
+        if result is not None:
+            cache.move_to_end(key)
+            self.hits += 1
+            return result
+
+        self.misses += 1
+        result = self.constraint.is_satisfied(assignment)
+        cache[key] = result
+        if len(cache) > self.size:
+            cache.popitem(last=False)
+        return result
+
+    def filter_supported(
+        self,
+        variable: Variable,
+        values: List[Value],
+        assignment: Assignment
+        ) -> List[bool]:
+        if self.bulk:
+            return self.constraint.filter_supported(variable, values, assignment)
+        return super().filter_supported(variable, values, assignment)
+
+    @property
+    def kind(self) -> str:
+        return self.constraint.kind
+
+    def __repr__(self) -> str:
+        return repr(self.constraint)
+
+
+# Values a propagator wants removed from the current domains
+Removals = List[Tuple[Variable, Value]]
+
+
+class GlobalConstraint(Constraint):
+    """
+    Constraint that filters domains with its own propagator instead of the
+    generic support search. Propagators only read the current domains and
+    report what to prune, so the engine applies every removal through the same
+    trail and queue as ordinary revisions. They must reach their own fixpoint,
+    as the engine does not requeue a constraint for the changes it made.
+    """
+
+    @abstractmethod
+    def propagate(
+        self,
+        domains: DomainStore,
+        changed: Optional[Variable]
+        ) -> Optional[Removals]:
+        """
+        Returns the values to prune after the domain of <changed> shrank (or
+        after any change when <changed> is None), or None if the constraint
+        can no longer be satisfied
+        """
+        pass
+
+    def explain(self, variable: Variable, value: Value) -> List[Variable]:
+        """
+        Variables whose current domains justify the last propagate() call
+        pruning <value> from <variable>. Used by backjumping; the whole scope
+        is always a safe answer.
+        """
+        return self.scope
+
+    def explain_failure(self) -> List[Variable]:
+        """Variables whose current domains justify the last propagate() failing"""
+        return self.scope
+
+
+class AllDifferent(GlobalConstraint):
+    """
+    All variables in scope take pairwise distinct values.
+
+    ELIMINATION removes the value of every fixed variable from the others.
+    GAC is Regin's filtering: values that belong to no maximum matching of the
+    variable-value graph are pruned. The matching is kept between calls and
+    only repaired where its values were pruned, so it carries across search.
+    """
+
+    ELIMINATION = "elimination"
+    GAC = "gac"
+
+    def __init__(self, scope: List[Variable], mode: str = GAC) -> None:
+        if mode not in (AllDifferent.ELIMINATION, AllDifferent.GAC):
+            raise ValueError(f"Unknown AllDifferent mode '{mode}'")
+        super().__init__(scope)
+        self.mode = mode
+        self.matching: Dict[Variable, Value] = {}
+
+    def is_satisfied(self, assignment: Assignment) -> bool:
+        values = [assignment[variable] for variable in self.scope]
+        return len(set(values)) == len(values)
+
+    def propagate(
+        self,
+        domains: DomainStore,
+        changed: Optional[Variable]
+        ) -> Optional[Removals]:
+
+        if self.mode == AllDifferent.ELIMINATION:
+            return self._eliminate(domains, changed)
+        return self._filter(domains)
+
+    def _eliminate(
+        self,
+        domains: DomainStore,
+        changed: Optional[Variable]
+        ) -> Optional[Removals]:
+
+        removals: Removals = []
+        removed: Dict[Variable, Set[Value]] = {var: set() for var in self.scope}
+
+        # Only a newly fixed variable can eliminate anything
+        candidates = self.scope if changed is None else [changed]
+        fixed = [var for var in candidates if domains.size(var) == 1]
+
+        while len(fixed) > 0:
+            var = fixed.pop()
+            value = [val for val in domains[var] if val not in removed[var]][0]
+
+            for other in self.scope:
+                if other == var or value in removed[other]:
+                    continue
+                if not domains.contains(other, value):
+                    continue
+
+                removed[other].add(value)
+                removals.append((other, value))
+
+                remaining = domains.size(other) - len(removed[other])
+                if remaining == 0:
+                    return None
+                if remaining == 1:
+                    fixed.append(other)
+
+        return removals
+
+    def _filter(self, domains: DomainStore) -> Optional[Removals]:
+
+        live = {var: domains[var] for var in self.scope}
+        if not self._repair_matching(domains, live):
+            return None
+
+        owner = {value: var for var, value in self.matching.items()}
+
+        # Matched edges point from variable to value, the rest from value to
+        # variable. An unmatched edge is kept if it lies on an alternating
+        # cycle (both ends in one strongly connected component) or on an even
+        # alternating path from a free value (its value is reachable from one)
+        reachable = self._reachable_from_free_values(live, owner)
+        component = self._components(live, owner)
+
+        removals: Removals = []
+        for var in self.scope:
+            matched = self.matching[var]
+            for value in live[var]:
+                if value == matched or value in reachable:
+                    continue
+                if component[("var", var)] == component[("val", value)]:
+                    continue
+                removals.append((var, value))
+
+        return removals
+
+    def _repair_matching(
+        self,
+        domains: DomainStore,
+        live: Domain
+        ) -> bool:
+
+        # Drop edges whose values were pruned since the last call
+        owner: Dict[Value, Variable] = {}
+        for var in self.scope:
+            value = self.matching.get(var)
+            if value is None:
+                continue
+            if not domains.contains(var, value) or value in owner:
+                del self.matching[var]
+                continue
+            owner[value] = var
+
+        for var in self.scope:
+            if var not in self.matching and not self._augment(var, live, owner):
+                return False
+
+        return True
+
+    def _augment(
+        self,
+        root: Variable,
+        live: Domain,
+        owner: Dict[Value, Variable]
+        ) -> bool:
+
+        # Iterative DFS for an alternating path from <root> to a free value
+        parent: Dict[Variable, Tuple[Optional[Variable], Optional[Value]]] = {
+            root: (None, None)
+        }
+        stack = [root]
+        visited_values: Set[Value] = set()
+
+        while len(stack) > 0:
+            var = stack.pop()
+            for value in live[var]:
+                if value in visited_values:
+                    continue
+                visited_values.add(value)
+
+                if value not in owner:
+                    # Flip the path back to the root
+                    while var is not None:
+                        owner[value] = var
+                        prev_var, prev_value = parent[var]
+                        self.matching[var] = value
+                        var, value = prev_var, prev_value
+                    return True
+
+                next_var = owner[value]
+                if next_var not in parent:
+                    parent[next_var] = (var, value)
+                    stack.append(next_var)
+
+        return False
+
+    def _reachable_from_free_values(
+        self,
+        live: Domain,
+        owner: Dict[Value, Variable]
+        ) -> Set[Value]:
+
+        holders: Dict[Value, List[Variable]] = {}
+        for var in self.scope:
+            for value in live[var]:
+                holders.setdefault(value, []).append(var)
+
+        stack = [value for value in holders if value not in owner]
+        reachable: Set[Value] = set(stack)
+
+        while len(stack) > 0:
+            value = stack.pop()
+            for var in holders[value]:
+                matched = self.matching[var]
+                if matched not in reachable:
+                    reachable.add(matched)
+                    stack.append(matched)
+
+        return reachable
+
+    def _components(
+        self,
+        live: Domain,
+        owner: Dict[Value, Variable]
+        ) -> Dict[Tuple[str, object], int]:
+
+        # Iterative Tarjan over the variable-value graph restricted to matched
+        # values; free values cannot be on a cycle
+        graph: Dict[Tuple[str, object], List[Tuple[str, object]]] = {}
+        for var in self.scope:
+            graph[("var", var)] = [("val", self.matching[var])]
+        for var in self.scope:
+            for value in live[var]:
+                if value in owner and value != self.matching[var]:
+                    graph.setdefault(("val", value), []).append(("var", var))
+        for var in self.scope:
+            graph.setdefault(("val", self.matching[var]), [])
+
+        index: Dict[Tuple[str, object], int] = {}
+        lowlink: Dict[Tuple[str, object], int] = {}
+        component: Dict[Tuple[str, object], int] = {}
+        on_stack: Set[Tuple[str, object]] = set()
+        scc_stack: List[Tuple[str, object]] = []
+        counter = 0
+
+        for start in graph:
+            if start in index:
+                continue
+            work = [(start, 0)]
+            while len(work) > 0:
+                node, child = work.pop()
+                if child == 0:
+                    index[node] = lowlink[node] = counter
+                    counter += 1
+                    scc_stack.append(node)
+                    on_stack.add(node)
+
+                successors = graph[node]
+                if child < len(successors):
+                    work.append((node, child + 1))
+                    successor = successors[child]
+                    if successor not in index:
+                        work.append((successor, 0))
+                    elif successor in on_stack:
+                        lowlink[node] = min(lowlink[node], index[successor])
+                    continue
+
+                if lowlink[node] == index[node]:
+                    while True:
+                        member = scc_stack.pop()
+                        on_stack.discard(member)
+                        component[member] = index[node]
+                        if member == node:
+                            break
+                if len(work) > 0:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+
+        # Free values get their own components
+        for var in self.scope:
+            for value in live[var]:
+                if ("val", value) not in component:
+                    component[("val", value)] = -1 - len(component)
+
+        return component
+
+
+Decision = Tuple[Variable, Value]
+
+
+class NogoodStore(GlobalConstraint):
+    """
+    Combinations of decisions that are known to lead nowhere, each a list of
+    (variable, value) pairs that may not all hold at once. Once every pair of
+    a nogood but one holds, the value of the remaining pair is pruned.
+
+    Each nogood watches two of its pairs that do not hold yet, and is only
+    looked at when one of them comes to hold, i.e. its variable is fixed to
+    that value. Watches stay valid when domains are restored on backtrack,
+    so only nogoods added since the last call without a changed variable
+    are ever looked at in full.
+    """
+
+    def __init__(self, scope: List[Variable]) -> None:
+        super().__init__(scope)
+        self.nogoods: List[List[Decision]] = []
+        self.watched: List[List[Decision]] = []
+        self.watches: DefaultDict[Decision, List[int]] = defaultdict(list)
+        # Nogoods looked at in full so far, in order of addition
+        self.checked = 0
+        # Variables of the nogood behind each removal of the last propagate()
+        # call, and of the nogood it found violated
+        self.blame: Dict[Decision, List[Variable]] = {}
+        self.violated: List[Variable] = []
+
+    def add(self, nogood: List[Decision]) -> None:
+        index = len(self.nogoods)
+        self.nogoods.append(nogood)
+        # The deepest decisions are the last to hold again after a restart
+        watched = nogood[-2:]
+        self.watched.append(watched)
+        for pair in watched:
+            self.watches[pair].append(index)
+
+    def __len__(self) -> int:
+        return len(self.nogoods)
+
+    def is_satisfied(self, assignment: Assignment) -> bool:
+        for nogood in self.nogoods:
+            if all(assignment[var] == value for var, value in nogood):
+                return False
+        return True
+
+    def propagate(
+        self,
+        domains: DomainStore,
+        changed: Optional[Variable]
+        ) -> Optional[Removals]:
+
+        if changed is None:
+            # Older nogoods only need a look if a watch of theirs holds
+            candidates: List[int] = list(range(self.checked, len(self.nogoods)))
+            for var in self.scope:
+                if domains.size(var) == 1:
+                    candidates += self.watches.get((var, domains[var][0]), [])
+        elif domains.size(changed) != 1:
+            return []
+        else:
+            candidates = list(self.watches.get((changed, domains[changed][0]), []))
+
+        removals: Removals = []
+        self.blame = {}
+        for index in candidates:
+            if not self._visit(index, domains, removals):
+                self.violated = [var for var, _ in self.nogoods[index]]
+                return None
+        if changed is None:
+            self.checked = len(self.nogoods)
+        return removals
+
+    def explain(self, variable: Variable, value: Value) -> List[Variable]:
+        return self.blame.get((variable, value), self.scope)
+
+    def explain_failure(self) -> List[Variable]:
+        return self.violated
+
+    def _visit(self, index: int, domains: DomainStore, removals: Removals) -> bool:
+        nogood = self.nogoods[index]
+        watched = self.watched[index]
+
+        if len(nogood) == 1:
+            var, value = nogood[0]
+            if not domains.contains(var, value):
+                return True
+            if domains.size(var) == 1:
+                return False
+            removals.append((var, value))
+            self.blame[(var, value)] = []
+            return True
+
+        for slot in range(2):
+            pair = watched[slot]
+            if not self._holds(domains, pair):
+                continue
+
+            for candidate in nogood:
+                if candidate not in watched and not self._holds(domains, candidate):
+                    self.watches[pair].remove(index)
+                    self.watches[candidate].append(index)
+                    watched[slot] = candidate
+                    break
+            else:
+                # Every pair but the other watch holds
+                var, value = watched[1 - slot]
+                if self._holds(domains, watched[1 - slot]):
+                    return False
+                if domains.contains(var, value):
+                    removals.append((var, value))
+                    self.blame[(var, value)] = [
+                        other for other, _ in nogood if other != var
+                    ]
+                return True
+
+        return True
+
+    def _holds(self, domains: DomainStore, pair: Decision) -> bool:
+        var, value = pair
+        return domains.size(var) == 1 and domains.contains(var, value)
+
+
+class TableConstraint(GlobalConstraint):
+    """
+    Constraint given by its allowed tuples, filtered with Compact-Table. Each
+    (position, value) pair maps to a bitset of the tuples holding that value
+    there, and <current> is the bitset of tuples still valid under the
+    current domains. A value is supported while its bitset meets <current>.
+    Changes to <current> go on the domain trail and are undone on backtrack,
+    and backtracking above the depth the table was first propagated at has
+    <current> computed over again.
+    """
+
+    def __init__(self, scope: List[Variable], tuples: List[Tuple[Value, ...]]) -> None:
+        super().__init__(scope)
+        self.tuples = list(tuples)
+        self.allowed = set(self.tuples)
+        self.supports: List[Dict[Value, int]] = [{} for _ in scope]
+        for index, row in enumerate(self.tuples):
+            if len(row) != len(scope):
+                raise ValueError("Table tuples must match the constraint's scope")
+            for position, value in enumerate(row):
+                supports = self.supports[position]
+                supports[value] = supports.get(value, 0) | (1 << index)
+        self.current = (1 << len(self.tuples)) - 1
+        # Store the valid tuples are tracked against. A constraint reused by
+        # another CSP starts over from every tuple
+        self.store: Optional[DomainStore] = None
+
+    def is_satisfied(self, assignment: Assignment) -> bool:
+        return tuple(assignment[var] for var in self.scope) in self.allowed
+
+    def propagate(
+        self,
+        domains: DomainStore,
+        changed: Optional[Variable]
+        ) -> Optional[Removals]:
+
+        if domains is not self.store:
+            # Checked against the domains at this depth, so backtracking above
+            # it has every tuple checked over again
+            domains.push_undo(self, (domains, None))
+            self.store = domains
+            self.current = (1 << len(self.tuples)) - 1
+            changed = None
+
+        current = self.current
+        for position, var in enumerate(self.scope):
+            if changed is not None and var != changed:
+                continue
+            supports = self.supports[position]
+            mask = 0
+            for value in domains[var]:
+                mask |= supports.get(value, 0)
+            current &= mask
+
+        if current == 0:
+            return None
+        if current != self.current:
+            domains.push_undo(self, (domains, self.current))
+            self.current = current
+
+        removals: Removals = []
+        for position, var in enumerate(self.scope):
+            supports = self.supports[position]
+            for value in domains[var]:
+                if supports.get(value, 0) & current == 0:
+                    removals.append((var, value))
+        return removals
+
+    def undo(self, token: Tuple[DomainStore, Optional[int]]) -> None:
+        store, current = token
+        if store is not self.store:
+            return
+        if current is None:
+            self.store = None
+        else:
+            self.current = current
+
+    def __repr__(self) -> str:
+        return f"Table: {self.scope} ({len(self.tuples)} tuples)"
+
+
+# Largest Cartesian product tabulate() will enumerate
+TABULATE_LIMIT = 100000
+
+
+def tabulate(constraint: Constraint, domains: Domain) -> TableConstraint:
+    """
+    Table of the tuples of <domains> that satisfy <constraint>, for
+    constraints whose scope is small enough to enumerate
+    """
+    size = 1
+    for var in constraint.scope:
+        size *= len(domains[var])
+    if size > TABULATE_LIMIT:
+        raise ValueError(
+            f"Cannot tabulate {constraint}: {size} tuples exceeds {TABULATE_LIMIT}"
+        )
+
+    tuples = [
+        row for row in itertools.product(*(domains[var] for var in constraint.scope))
+        if constraint.is_satisfied(dict(zip(constraint.scope, row)))
+    ]
+    return TableConstraint(constraint.scope, tuples)
+
+
+# A queued propagation event: the constraint to revise and the variable whose
+# domain changed, or None when every variable in scope must be revised
+Event = Tuple[Constraint, Optional[Variable]]
+
+
+class PropagationQueue(ABC):
+
+    @abstractmethod
+    def push(self, constraint: Constraint, variable: Optional[Variable]) -> None:
+        pass
+
+    @abstractmethod
+    def pop(self) -> Event:
+        pass
+
+    @abstractmethod
+    def clear(self) -> None:
+        pass
+
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
+
+
+class ArcQueue(PropagationQueue):
+    """
+    FIFO of (constraint, changed variable) events. Membership is tracked in a
+    set so duplicate events are dropped in O(1), and popping an event only
+    revises the arcs of the constraint that the change can affect.
+    """
+
+    def __init__(self) -> None:
+        self.events: Deque[Event] = deque()
+        self.pending: Set[Event] = set()
+
+    def push(self, constraint: Constraint, variable: Optional[Variable]) -> None:
+        event = (constraint, variable)
+        if event in self.pending:
+            return
+        self.pending.add(event)
+        self.events.append(event)
+
+    def pop(self) -> Event:
+        event = self.events.popleft()
+        self.pending.discard(event)
+        return event
+
+    def clear(self) -> None:
+        self.events.clear()
+        self.pending.clear()
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+
+class ConstraintQueue(PropagationQueue):
+    """
+    The original constraint stack: every variable in a popped constraint's
+    scope is revised. Kept so both queues can be benchmarked side by side.
+    """
+
+    def __init__(self) -> None:
+        self.constraints: List[Constraint] = []
+
+    def push(self, constraint: Constraint, variable: Optional[Variable]) -> None:
+        if constraint not in self.constraints:
+            self.constraints.append(constraint)
+
+    def pop(self) -> Event:
+        return self.constraints.pop(), None
+
+    def clear(self) -> None:
+        self.constraints = []
+
+    def __len__(self) -> int:
+        return len(self.constraints)
+
+
+class NullQueue(PropagationQueue):
+    """Drops every event; used when propagation does not cascade"""
+
+    def push(self, constraint: Constraint, variable: Optional[Variable]) -> None:
+        pass
+
+    def pop(self) -> Event:
+        raise IndexError("pop from an empty queue")
+
+    def clear(self) -> None:
+        pass
+
+    def __len__(self) -> int:
+        return 0
+
+
+ARC_QUEUE = "arc"
+CONSTRAINT_QUEUE = "constraint"
+
+QUEUES = {
+    ARC_QUEUE: ArcQueue,
+    CONSTRAINT_QUEUE: ConstraintQueue,
+}
+
+# Propagation levels run after each assignment
+NO_PROPAGATION = "none"
+FORWARD_CHECKING = "fc"
+GAC = "gac"
+PROPAGATION_LEVELS = [NO_PROPAGATION, FORWARD_CHECKING, GAC]
+
+
+class ChoicePoint:
+    """Variable assigned at one depth of the search, and its values to try"""
+
+    __slots__ = ("variable", "values", "index", "conflict")
+
+    def __init__(self, variable: Variable, values: List[Value]) -> None:
+        self.variable = variable
+        self.values = values
+        # Index of the next value to try
+        self.index = 0
+        # Bitmask of the shallower depths involved in refuting the values
+        # tried so far, for backjumping
+        self.conflict = 0
+
+
+class Explanations:
+    """
+    Bitmask per variable of the search depths whose decisions account for
+    the values pruned from its domain so far. Changes are recorded on the
+    domain trail, so they are undone together with the prunes they explain.
+    """
+
+    def __init__(self, variables: List[Variable], domains: DomainStore) -> None:
+        self.masks: Dict[Variable, int] = {var: 0 for var in variables}
+        self.domains = domains
+
+    def add(self, variable: Variable, mask: int) -> None:
+        old = self.masks[variable]
+        if old | mask != old:
+            self.domains.push_undo(self, (variable, old))
+            self.masks[variable] = old | mask
+
+    def of(self, variables: List[Variable], excluding: Optional[Variable] = None) -> int:
+        mask = 0
+        masks = self.masks
+        for var in variables:
+            if var != excluding:
+                mask |= masks[var]
+        return mask
+
+    def undo(self, token: Tuple[Variable, int]) -> None:
+        variable, mask = token
+        self.masks[variable] = mask
+
+
+class SearchState:
+    """
+    Picklable snapshot of a search: the (variable, value, untried values)
+    decision made at each depth, and whether the search was about to open
+    a new node or backtrack out of a solution.
+    """
+
+    def __init__(
+        self,
+        path: List[Tuple[Variable, Value, List[Value]]],
+        descend: bool,
+        nodes: int
+        ) -> None:
+        self.path = path
+        self.descend = descend
+        self.nodes = nodes
+
+
+class SearchStats:
+    """
+    Counters of a search, with propagation calls, is_satisfied checks and
+    time broken down by constraint class. Only filled in by a CSP built with
+    stats enabled.
+    """
+
+    def __init__(self) -> None:
+        self.nodes = 0
+        self.failures = 0
+        self.restarts = 0
+        self.wipeouts = 0
+        self.max_depth = 0
+        self.peak_trail = 0
+        self.seconds = 0.0
+        # Memo cache lookups answered from the cache and computed afresh
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.calls: DefaultDict[str, int] = defaultdict(int)
+        self.checks: DefaultDict[str, int] = defaultdict(int)
+        self.times: DefaultDict[str, float] = defaultdict(float)
+
+    @property
+    def propagations(self) -> int:
+        return sum(self.calls.values())
+
+    @property
+    def total_checks(self) -> int:
+        return sum(self.checks.values())
+
+    def as_dict(self) -> Dict[str, object]:
+        """The counters, and calls, checks and seconds by constraint class"""
+        return {
+            "nodes": self.nodes,
+            "failures": self.failures,
+            "restarts": self.restarts,
+            "wipeouts": self.wipeouts,
+            "propagations": self.propagations,
+            "checks": self.total_checks,
+            "max_depth": self.max_depth,
+            "peak_trail": self.peak_trail,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "seconds": self.seconds,
+            "constraints": {
+                name: {
+                    "calls": self.calls[name],
+                    "checks": self.checks[name],
+                    "seconds": self.times[name],
+                }
+                for name in sorted(set(self.calls) | set(self.checks))
+            },
+        }
+
+    def __str__(self) -> str:
+        lines = [
+            f"nodes         {self.nodes}",
+            f"failures      {self.failures}",
+            f"restarts      {self.restarts}",
+            f"wipeouts      {self.wipeouts}",
+            f"propagations  {self.propagations}",
+            f"checks        {self.total_checks}",
+            f"max depth     {self.max_depth}",
+            f"peak trail    {self.peak_trail}",
+            f"seconds       {self.seconds:.3f}",
+        ]
+        if self.cache_hits + self.cache_misses > 0:
+            lines.insert(-1, f"cache hits    {self.cache_hits}")
+            lines.insert(-1, f"cache misses  {self.cache_misses}")
+        names = sorted(
+            set(self.calls) | set(self.checks), key=lambda name: -self.times[name]
+        )
+        if len(names) > 0:
+            width = max(len(name) for name in names)
+            lines.append(
+                f"{'constraint':<{width}}  {'calls':>10}  {'checks':>10}  {'seconds':>8}"
+            )
+            for name in names:
+                lines.append(
+                    f"{name:<{width}}  {self.calls[name]:>10}  "
+                    f"{self.checks[name]:>10}  {self.times[name]:>8.3f}"
+                )
+        return "\n".join(lines)
+
+
+class SearchListener:
+    """
+    Receives the events of every search it is added to through
+    CSP.add_listener. Each method does nothing unless overridden.
+    """
+
+    def on_assign(self, depth: int, variable: Variable, value: Value) -> None:
+        """<variable> is about to be set to <value> at <depth>"""
+
+    def on_prune(self, depth: int, variable: Variable, values: List[Value]) -> None:
+        """Propagation removed <values> from the domain of <variable>"""
+
+    def on_wipeout(self, depth: int, constraint: Constraint) -> None:
+        """Propagating <constraint> failed, refuting the assignment at <depth>"""
+
+    def on_backtrack(self, depth: int) -> None:
+        """Everything done at <depth> and below is about to be undone"""
+
+    def on_restart(self) -> None:
+        """The search is about to start over from the root"""
+
+    def on_solution(self, assignment: Assignment) -> None:
+        """The search found <assignment>"""
+
 
 class CSP:
 
@@ -29,59 +923,614 @@ class CSP:
         domains: Domain,
         constraints: List[Constraint],
         vars_to_cons: Dict[Variable, List[Constraint]],
-        assigned_variables: List[Variable] = []
+        assigned_variables: List[Variable] = [],
+        queue: str = ARC_QUEUE,
+        backends: Optional[Dict[Variable, str]] = None,
+        variable_ordering: Union[str, VariableOrdering] = "input",
+        value_ordering: Union[str, ValueOrdering] = "lexical",
+        propagation: str = GAC,
+        backjumping: bool = False,
+        learning: bool = False,
+        stats: bool = False
         ) -> None:
 
+        if queue not in QUEUES:
+            raise ValueError(f"Unknown propagation queue '{queue}'")
+        if propagation not in PROPAGATION_LEVELS:
+            raise ValueError(f"Unknown propagation level '{propagation}'")
+
         self.variables = variables
         self.domains = domains
         self.constraints = constraints
         self.vars_to_cons = vars_to_cons
+        self.backends = backends
+        self.propagation = propagation
+        # Conflict-directed backjumping, optionally learning each conflict
+        # that causes a jump as a nogood
+        self.backjumping = backjumping or learning
+        self.learning = learning
+        # Search nodes visited, failed assignments and restarts
+        self.nodes = 0
+        self.failures = 0
+        self.restarts = 0
+        # Nogoods learned by the search, created on first use
+        self.nogoods: Optional[NogoodStore] = None
+        # Choice points of the current search path, one per assigned variable
+        self.stack: List[ChoicePoint] = []
+        # Whether the search loop opens a new node next, rather than trying
+        # the next value of the top choice point
+        self.descend = True
 
         self._init_curr_domains()
+        self.explanations: Optional[Explanations] = \
+            Explanations(variables, self.curr_domains) if self.backjumping else None
+        # Depths involved in the last failed propagation
+        self.conflict = 0
         self._init_assigned_vars(assigned_variables)
-        self.pruned_domains_at_depth: Dict[int, Domain] = {}
-        self.gac_stack: List[Constraint] = []
+        self._init_variable_ordering(variable_ordering)
+        self.value_ordering = make_value_ordering(value_ordering)
+        self.value_ordering.attach(self)
+        # Below GAC, prunes do not cascade to other constraints
+        self.gac_queue: PropagationQueue = \
+            QUEUES[queue]() if propagation == GAC else NullQueue()
+        self._init_residues()
+        # Counters of every search run so far, when built with stats. They
+        # are read from here rather than returned with the solutions
+        self.stats: Optional[SearchStats] = None
+        if stats:
+            self._init_stats()
+        self.listeners: List[SearchListener] = []
+
+    def add_listener(self, listener: SearchListener) -> None:
+        if len(self.listeners) == 0:
+            self._init_events()
+        self.listeners.append(listener)
+
+    def _init_events(self) -> None:
+        # As with stats, events are raised by wrappers that shadow the search
+        # methods, installed once the first listener is added
+        listeners = self.listeners
+        search = self._search
+        assign = self._assign
+        prune_curr_domain = self._prune_curr_domain
+        on_wipeout = self._on_wipeout
+        restore_pruned_domains = self._restore_pruned_domains
+        restart = self._restart
+
+        def search_and_notify(
+            node_limit: Optional[int], failure_limit: Optional[int]) -> Optional[bool]:
+            result = search(node_limit, failure_limit)
+            if result:
+                assignment = self.assignment()
+                for listener in listeners:
+                    listener.on_solution(assignment)
+            return result
+
+        def assign_and_notify(depth: int, var: Variable, value: Value) -> bool:
+            for listener in listeners:
+                listener.on_assign(depth, var, value)
+            return assign(depth, var, value)
+
+        def prune_and_notify(
+            depth: int,
+            variable: Variable,
+            values: List[Value],
+            _except: Union[Value, None] = None
+            ) -> None:
+            # Values an assignment removes from its own variable are implied
+            # by the assign event
+            if _except is None:
+                values = list(values)
+                for listener in listeners:
+                    listener.on_prune(depth, variable, values)
+            prune_curr_domain(depth, variable, values, _except)
+
+        def wipeout_and_notify(constraint: Constraint) -> None:
+            depth = len(self.stack) - 1
+            for listener in listeners:
+                listener.on_wipeout(depth, constraint)
+            on_wipeout(constraint)
+
+        def restore_and_notify(depth: int) -> None:
+            for listener in listeners:
+                listener.on_backtrack(depth)
+            restore_pruned_domains(depth)
+
+        def restart_and_notify(rng: random.Random) -> None:
+            for listener in listeners:
+                listener.on_restart()
+            restart(rng)
+
+        self._search = search_and_notify  # type: ignore
+        self._assign = assign_and_notify  # type: ignore
+        self._prune_curr_domain = prune_and_notify  # type: ignore
+        self._on_wipeout = wipeout_and_notify  # type: ignore
+        self._restore_pruned_domains = restore_and_notify  # type: ignore
+        self._restart = restart_and_notify  # type: ignore
+
+    def _init_stats(self) -> None:
+        # Instrumented versions of the hot methods shadow the plain ones on
+        # this instance only, so a search without stats pays nothing for them
+        stats = self.stats = SearchStats()
+        revise = self._revise
+        propagate = self._propagate
+        find_support = self._find_support
+        is_consistent = self._is_consistent
+        restore_pruned_domains = self._restore_pruned_domains
+        clock = time.perf_counter
+        # Memo counters belong to the constraints, which every CSP built from
+        # the same model shares, so only their growth from here on is counted
+        memos = [c for c in self.constraints if isinstance(c, MemoizedConstraint)]
+        hits = sum(memo.hits for memo in memos)
+        misses = sum(memo.misses for memo in memos)
+
+        def timed_revise(depth: int, constraint: Constraint, variable: Variable) -> bool:
+            name = constraint.kind
+            start = clock()
+            result = revise(depth, constraint, variable)
+            stats.times[name] += clock() - start
+            stats.calls[name] += 1
+            return result
+
+        def timed_propagate(
+            depth: int, constraint: GlobalConstraint, changed: Optional[Variable]) -> bool:
+            name = constraint.kind
+            start = clock()
+            result = propagate(depth, constraint, changed)
+            stats.times[name] += clock() - start
+            stats.calls[name] += 1
+            return result
+
+        def counted_find_support(
+            constraint: Constraint, support: Assignment, vars_assigned: int) -> bool:
+            if vars_assigned == len(constraint.scope):
+                stats.checks[constraint.kind] += 1
+            return find_support(constraint, support, vars_assigned)
+
+        def counted_is_consistent(constraint: Constraint) -> bool:
+            stats.checks[constraint.kind] += 1
+            return is_consistent(constraint)
+
+        def record_caches() -> None:
+            stats.cache_hits = sum(memo.hits for memo in memos) - hits
+            stats.cache_misses = sum(memo.misses for memo in memos) - misses
+
+        def measured_restore_pruned_domains(depth: int) -> None:
+            # The trail and the stack peak just before backtracking
+            self._record_peaks()
+            restore_pruned_domains(depth)
+
+        self._revise = timed_revise  # type: ignore
+        self._propagate = timed_propagate  # type: ignore
+        self._find_support = counted_find_support  # type: ignore
+        self._is_consistent = counted_is_consistent  # type: ignore
+        self._restore_pruned_domains = measured_restore_pruned_domains  # type: ignore
+        self._record_caches = record_caches  # type: ignore
+
+    def _record_caches(self) -> None:
+        # Replaced by _init_stats, which knows the counters to start from
+        pass
+
+    def _record_peaks(self) -> None:
+        stats = self.stats
+        stats.peak_trail = max(stats.peak_trail, len(self.curr_domains.trail))
+        stats.max_depth = max(stats.max_depth, len(self.stack))
 
     def _init_curr_domains(self) -> None:
-        self.curr_domains: Domain = {}
-        for variable in self.domains:
-            self.curr_domains[variable] = [val for val in self.domains[variable]]
+        self.curr_domains: DomainStore = DomainStore(self.domains, self.backends)
+
+    def _init_residues(self) -> None:
+        # Last support found for each value of each (constraint, variable) arc.
+        # Residues are re-validated on use, so they survive backtracking
+        # without any restore work
+        self.residues: DefaultDict[
+            Tuple[Constraint, Variable], Dict[Value, Assignment]
+        ] = defaultdict(dict)
 
     def _init_assigned_vars(self, assigned_variables: List[Variable]) -> None:
+        assigned_set = set(assigned_variables)
         self.assigned: Dict[Variable, bool] = {}
         for var in self.variables:
-            self.assigned[var] = var in assigned_variables
+            self.assigned[var] = var in assigned_set
 
-    def satisfy(self, depth: int = 0) -> Tuple[bool, Domain]:
+    def _init_variable_ordering(
+        self, variable_ordering: Union[str, VariableOrdering]) -> None:
+        self.variable_ordering = make_variable_ordering(variable_ordering)
+        self.variable_ordering.attach(self)
+        self.unassigned_queue = VariableQueue(self, self.variable_ordering)
 
-        var = self._pick_unassigned_variable()
-        if var is None:
-            return True, self.curr_domains
-        self.assigned[var] = True
+    def satisfy(self) -> Tuple[bool, Domain]:
+        """
+        Searches for the next solution. Calling it again after a solution was
+        found continues the search from that solution
+        """
+        if self.search():
+            return True, self.curr_domains.snapshot()
+        return False, {}
 
-        for value in self.domains[var]:
+    def solutions(self, limit: Optional[int] = None) -> Iterator[Mapping[Variable, Value]]:
+        """
+        Lazily yields up to <limit> solutions as read-only variable to value
+        mappings, carrying on from wherever the search currently is
+        """
+        found = 0
+        while limit is None or found < limit:
+            if not self.search():
+                return
+            found += 1
+            yield MappingProxyType(self.assignment())
 
-            self.gac_stack = [con for con in self.vars_to_cons[var]]
-            self._prune_curr_domain(
-                depth, var, copy.copy(self.curr_domains[var]), _except=value
-            )
+    def count(self, limit: Optional[int] = None) -> int:
+        """Counts up to <limit> solutions without building any of them"""
+        found = 0
+        while limit is None or found < limit:
+            if not self.search():
+                break
+            found += 1
+        return found
 
-            if self.gac_enforce(depth) == True:
-                solved, state = self.satisfy(depth + 1)
-                if solved:
-                    return True, state
-            self._restore_pruned_domains(depth)
+    def assignment(self) -> Assignment:
+        """Solution found by the last call to search() that returned True"""
+        # Every variable has a singleton domain once a solution is found
+        return {var: self.curr_domains[var][0] for var in self.variables}
 
-        self.assigned[var] = False
+    def search(
+        self,
+        node_limit: Optional[int] = None,
+        failure_limit: Optional[int] = None
+        ) -> Optional[bool]:
+        """
+        Runs the search loop until a solution is found (True), the search
+        space is exhausted (False), or <node_limit> more nodes have been
+        visited or <failure_limit> more assignments have failed (None). The
+        search can be resumed by calling it again.
+        """
+        stats = self.stats
+        if stats is None:
+            return self._search(node_limit, failure_limit)
 
-        return False, {}
+        start = time.perf_counter()
+        result = self._search(node_limit, failure_limit)
+        stats.seconds += time.perf_counter() - start
+        stats.nodes = self.nodes
+        stats.failures = self.failures
+        stats.restarts = self.restarts
+        self._record_peaks()
+        self._record_caches()
+        return result
 
-    def _pick_unassigned_variable(self) -> Union[Variable, None]:
-        for var in self.assigned:
-            if not self.assigned[var]:
-                return var
+    def _search(
+        self,
+        node_limit: Optional[int],
+        failure_limit: Optional[int]
+        ) -> Optional[bool]:
+        stack = self.stack
+        nodes_left = node_limit
+        failures_left = failure_limit
+
+        while True:
+
+            if self.descend:
+                if nodes_left is not None:
+                    if nodes_left == 0:
+                        return None
+                    nodes_left -= 1
+                self.nodes += 1
+
+                var = self._pick_unassigned_variable()
+                if var is None:
+                    # Backtrack into the last choice point on resume
+                    self.descend = False
+                    if self.backjumping:
+                        # Values left to try above a solution are not refuted
+                        # by any conflict, so backtracking from here on has to
+                        # be chronological
+                        for level, above in enumerate(stack):
+                            above.conflict = (1 << level) - 1
+                    return True
+                self.assigned[var] = True
+
+                # Only values that survived propagation are tried
+                stack.append(ChoicePoint(
+                    var, self.value_ordering.order(self, var, self.curr_domains[var])
+                ))
+
+            if len(stack) == 0:
+                return False
+
+            choice = stack[-1]
+            depth = len(stack) - 1
+            if choice.index > 0:
+                self._restore_pruned_domains(depth)
+
+            if choice.index == len(choice.values):
+                stack.pop()
+                self.assigned[choice.variable] = False
+                self.unassigned_queue.push(choice.variable)
+                self.descend = False
+                if self.backjumping:
+                    self._backjump(choice.conflict)
+                continue
+
+            value = choice.values[choice.index]
+            choice.index += 1
+            self.descend = self._assign(depth, choice.variable, value)
+
+            if not self.descend:
+                self.failures += 1
+                if self.backjumping:
+                    choice.conflict |= self.conflict & ~(1 << depth)
+                    if not (self.conflict >> depth) & 1:
+                        # The failure does not involve this decision, so the
+                        # remaining values would fail the same way
+                        choice.index = len(choice.values)
+                if failures_left is not None:
+                    failures_left -= 1
+                    if failures_left == 0:
+                        return None
+
+    def _backjump(self, conflict: int) -> None:
+        """
+        Called once a choice point is exhausted with <conflict> as the depths
+        that refuted all of its values: unwinds the stack to the deepest of
+        them, whose next value is tried next
+        """
+        stack = self.stack
+        target = conflict.bit_length() - 1
+
+        if self.learning and conflict != 0:
+            self._learn([level for level in range(target + 1) if (conflict >> level) & 1])
+
+        if len(stack) > target + 1:
+            self._restore_pruned_domains(target + 1)
+            while len(stack) > target + 1:
+                skipped = stack.pop()
+                self.assigned[skipped.variable] = False
+                self.unassigned_queue.push(skipped.variable)
+
+        if target >= 0:
+            stack[target].conflict |= conflict & ~(1 << target)
+
+    def _learn(self, levels: List[int]) -> None:
+        # The decisions made at <levels> cannot all hold in any solution
+        if self.nogoods is None:
+            self._install_nogood_store()
+        self.nogoods.add([
+            (self.stack[level].variable,
+                self.stack[level].values[self.stack[level].index - 1])
+            for level in levels
+        ])
+
+    def search_with_restarts(
+        self,
+        schedule: Union[str, RestartSchedule] = "luby",
+        seed: Optional[int] = None,
+        learn_nogoods: bool = True
+        ) -> bool:
+        """
+        Searches in runs cut off after the number of failures given by
+        <schedule>. Each run breaks variable ordering ties differently, and
+        with <learn_nogoods> the refuted decisions of each run are recorded
+        so later runs never revisit them. Returns whether a solution was found.
+        """
+        rng = random.Random(seed)
+
+        for cutoff in make_restart_schedule(schedule):
+            result = self.search(failure_limit=cutoff)
+            if result is not None:
+                return result
+
+            if learn_nogoods:
+                self._record_restart_nogoods()
+            self._restart(rng)
+
+            if self.nogoods is not None and not self._propagate_root_nogoods():
+                return False
+
+        return False
+
+    def _record_restart_nogoods(self) -> None:
+        """
+        Records the values refuted at each depth of the current path,
+        together with the decisions above them (reduced nld-nogoods)
+        """
+        if self.nogoods is None:
+            self._install_nogood_store()
+
+        decisions: List[Decision] = []
+        for depth, choice in enumerate(self.stack):
+            refuted = choice.values[:choice.index - 1]
+            # The run was cut off just after the top value failed
+            if depth == len(self.stack) - 1 and not self.descend:
+                refuted = choice.values[:choice.index]
+
+            for value in refuted:
+                self.nogoods.add(decisions + [(choice.variable, value)])
+            decisions.append((choice.variable, choice.values[choice.index - 1]))
+
+    def _install_nogood_store(self) -> None:
+        self.nogoods = NogoodStore(list(self.variables))
+        self.constraints = self.constraints + [self.nogoods]
+        # Copied so the builder's index is left untouched
+        self.vars_to_cons = {
+            var: self.vars_to_cons.get(var, []) + [self.nogoods]
+            for var in self.variables
+        }
+
+    def _restart(self, rng: random.Random) -> None:
+        if len(self.stack) > 0:
+            self.curr_domains.restore(0)
+        for choice in self.stack:
+            self.assigned[choice.variable] = False
+        self.stack.clear()
+        self.descend = True
+        self.restarts += 1
+        # Also rebuilds the queue, which puts the unassigned variables back
+        self.unassigned_queue.shuffle_ties(rng)
+
+    def _propagate_root_nogoods(self) -> bool:
+        # Prunes made before any depth is marked are never undone
+        removals = self.nogoods.propagate(self.curr_domains, None)
+        if removals is None:
+            return False
+        for variable, value in removals:
+            if self.curr_domains.contains(variable, value):
+                self.curr_domains.remove(variable, value)
+                if self.curr_domains.is_empty(variable):
+                    return False
+                self.unassigned_queue.update(variable)
+        return True
+
+    def _assign(self, depth: int, var: Variable, value: Value) -> bool:
+        self.curr_domains.mark(depth)
+        self._prune_curr_domain(
+            depth, var, self.curr_domains[var], _except=value
+        )
+        if self.explanations is not None:
+            self.explanations.add(var, 1 << depth)
+        return self._propagate_assignment(depth, var)
+
+    def snapshot_search(self) -> SearchState:
+        path = [
+            (choice.variable, choice.values[choice.index - 1],
+                choice.values[choice.index:])
+            for choice in self.stack
+        ]
+        return SearchState(path, self.descend, self.nodes)
+
+    def split_search(self) -> Optional[SearchState]:
+        """
+        Hands the untried values of the shallowest choice point that has any
+        over to a new SearchState, which this search will no longer explore.
+        Returns None when there is nothing left to split off.
+        """
+        for depth, choice in enumerate(self.stack):
+            if choice.index == len(choice.values):
+                continue
+            path = [
+                (above.variable, above.values[above.index - 1], [])
+                for above in self.stack[:depth]
+            ]
+            untried = choice.values[choice.index:]
+            path.append((choice.variable, untried[0], untried[1:]))
+            del choice.values[choice.index:]
+            # The values handed over are not refuted by this search's conflicts
+            choice.conflict = (1 << depth) - 1
+            return SearchState(path, True, 0)
         return None
 
+    def restore_search(self, state: SearchState) -> None:
+        """
+        Replays the decisions of <state> on a CSP that has not started
+        searching, so that search() carries on where the snapshot was taken
+        """
+        if len(self.stack) > 0:
+            raise ValueError("Search state can only be restored before searching")
+
+        descend = state.descend
+        for var, value, untried in state.path:
+            depth = len(self.stack)
+            if self.assigned[var] or not self.curr_domains.contains(var, value):
+                raise ValueError(f"Search state does not match this CSP at {var}")
+            self.assigned[var] = True
+            choice = ChoicePoint(var, [value] + list(untried))
+            choice.index = 1
+            # Conflicts are not part of the snapshot
+            choice.conflict = (1 << depth) - 1
+            self.stack.append(choice)
+            if self._assign(depth, var, value):
+                continue
+            # Only the last value can fail: a snapshot taken right after a
+            # failure ends on the failed value, and a split ends on a value
+            # that was never propagated. Search carries on with its siblings
+            if depth < len(state.path) - 1:
+                raise ValueError(f"Search state does not match this CSP at {var}")
+            if state.descend:
+                self.failures += 1
+            descend = False
+
+        self.descend = descend
+        self.nodes = state.nodes
+
+    def _propagate_assignment(self, depth: int, var: Variable) -> bool:
+
+        if self.propagation == GAC:
+            self.gac_queue.clear()
+            # Only <var> changed, which spares revising it and lets global
+            # propagators work from that one variable
+            for con in self.vars_to_cons.get(var, []):
+                self.gac_queue.push(con, var)
+            return self.gac_enforce(depth)
+
+        if self.propagation == FORWARD_CHECKING:
+            return self.forward_check(depth, var)
+
+        return self.backtrack_check(var)
+
+    def forward_check(self, depth: int, var: Variable) -> bool:
+        """
+        Prunes the last unassigned variable of every constraint on <var>, and
+        runs the propagators of global constraints once, without cascading
+        """
+        for constraint in self.vars_to_cons.get(var, []):
+
+            if isinstance(constraint, GlobalConstraint):
+                if not self._propagate(depth, constraint, var):
+                    self._on_wipeout(constraint)
+                    return False
+                continue
+
+            unassigned = [v for v in constraint.scope if not self.assigned[v]]
+            if len(unassigned) == 0:
+                if not self._is_consistent(constraint):
+                    self._on_wipeout(constraint)
+                    return False
+            elif len(unassigned) == 1:
+                if not self._revise(depth, constraint, unassigned[0]):
+                    self._on_wipeout(constraint)
+                    return False
+
+        return True
+
+    def backtrack_check(self, var: Variable) -> bool:
+        """Checks every constraint on <var> whose scope is fully assigned"""
+        for constraint in self.vars_to_cons.get(var, []):
+            if all(self.assigned[v] for v in constraint.scope) and \
+                not self._is_consistent(constraint):
+                self._on_wipeout(constraint)
+                return False
+        return True
+
+    def _is_consistent(self, constraint: Constraint) -> bool:
+        # Assigned variables have singleton domains
+        assignment = {v: self.curr_domains[v][0] for v in constraint.scope}
+        if constraint.is_satisfied(assignment):
+            return True
+        if self.explanations is not None:
+            self.conflict = self.explanations.of(constraint.scope)
+        return False
+
+    def _pick_unassigned_variable(self) -> Union[Variable, None]:
+        return self.unassigned_queue.pop()
+
+    def count_supports(self, variable: Variable, value: Value) -> int:
+        """
+        Number of values left in the other domains of binary constraints on
+        <variable> that are compatible with <variable> = <value>
+        """
+        count = 0
+        for constraint in self.vars_to_cons.get(variable, []):
+            if len(constraint.scope) != 2 or isinstance(constraint, GlobalConstraint):
+                continue
+            other = constraint.scope[0] if constraint.scope[1] == variable \
+                else constraint.scope[1]
+            if self.assigned[other]:
+                continue
+            count += sum(constraint.filter_supported(
+                other, self.curr_domains[other], { variable: value }
+            ))
+        return count
+
     def _prune_curr_domain(
         self,
         depth: int,
@@ -90,47 +1539,178 @@ class CSP:
         _except: Union[Value, None] = None
         ) -> None:
 
-        if depth not in self.pruned_domains_at_depth:
-            self.pruned_domains_at_depth[depth] = {}
-        if variable not in self.pruned_domains_at_depth[depth]:
-            self.pruned_domains_at_depth[depth][variable] = []
-
-        for value in values:
-            if value != _except:
-                self.curr_domains[variable].remove(value)
-                self.pruned_domains_at_depth[depth][variable].append(value)
+        if _except is None:
+            self.curr_domains.remove_all(variable, values)
+        else:
+            # An assignment keeps its value alone, whatever else is left
+            self.curr_domains.restrict(variable, [_except])
+        self.unassigned_queue.update(variable)
 
     def gac_enforce(self, depth) -> bool:
 
-        while len(self.gac_stack) > 0:
-            constraint = self.gac_stack.pop()
+        while len(self.gac_queue) > 0:
+            constraint, changed = self.gac_queue.pop()
+
+            if isinstance(constraint, GlobalConstraint):
+                if not self._propagate(depth, constraint, changed):
+                    self._on_wipeout(constraint)
+                    return False
+                continue
 
             for variable in constraint.scope:
-                for value in self.curr_domains[variable]:
+                # Supports for the changed variable's values are unaffected
+                if variable == changed:
+                    continue
+                if not self._revise(depth, constraint, variable):
+                    self._on_wipeout(constraint)
+                    return False
 
-                    if self._find_support(constraint, { variable: value }, 1):
-                        continue
+        return True
 
-                    self._prune_curr_domain(depth, variable, [value])
+    def _on_wipeout(self, constraint: Constraint) -> None:
+        if self.stats is not None:
+            self.stats.wipeouts += 1
+        self.gac_queue.clear()
+        for variable in self.variable_ordering.on_wipeout(self, constraint):
+            self.unassigned_queue.update(variable)
 
-                    # Domain wipe-out
-                    if len(self.curr_domains[variable]) == 0:
-                        self.gac_stack = []
-                        return False
+    def _revise(
+        self,
+        depth: int,
+        constraint: Constraint,
+        variable: Variable
+        ) -> bool:
+
+        values = self.curr_domains[variable]
+        unsupported: List[Value] = []
+
+        fixed = self._fixed_others(constraint, variable)
+        if fixed is not None:
+            # The only candidate supports are the fixed values, so the whole
+            # domain is checked in one call
+            supported = constraint.filter_supported(variable, values, fixed)
+            unsupported = [value for value, ok in zip(values, supported) if not ok]
+            if self.stats is not None:
+                self.stats.checks[constraint.kind] += len(values)
+        else:
+            residues = self.residues[(constraint, variable)]
+            domains = self.curr_domains.domains
+            for value in values:
+
+                # Residual support: the last tuple found for this value is
+                # still a support as long as all of its values are live
+                residue = residues.get(value)
+                if residue is not None:
+                    for other in residue:
+                        if residue[other] not in domains[other]:
+                            break
                     else:
-                        for related_constraint in self.vars_to_cons[variable]:
-                            # TODO: Implement a augmented DS for fast lookup
-                            if related_constraint not in self.gac_stack:
-                                self.gac_stack.append(related_constraint)
+                        continue
+
+                support = { variable: value }
+                if self._find_support(constraint, support, 1):
+                    if constraint.pure:
+                        self._store_residue(constraint, support)
+                    continue
+                unsupported.append(value)
+
+        if len(unsupported) == 0:
+            return True
+
+        self._prune_curr_domain(depth, variable, unsupported)
+        explanations = self.explanations
+        if explanations is not None:
+            # Support was sought in the other variables' current domains
+            explanations.add(
+                variable, explanations.of(constraint.scope, excluding=variable)
+            )
+
+        # Domain wipe-out
+        if self.curr_domains.size(variable) == 0:
+            if explanations is not None:
+                self.conflict = explanations.masks[variable]
+            return False
+
+        for related_constraint in self.vars_to_cons[variable]:
+            self.gac_queue.push(related_constraint, variable)
+
+        return True
+
+    def _fixed_others(
+        self,
+        constraint: Constraint,
+        variable: Variable
+        ) -> Optional[Assignment]:
+        # Values of the rest of the scope, if all of them are down to one
+        fixed: Assignment = {}
+        for other in constraint.scope:
+            if other == variable:
+                continue
+            if self.curr_domains.size(other) != 1:
+                return None
+            fixed[other] = self.curr_domains[other][0]
+        return fixed
+
+    def _propagate(
+        self,
+        depth: int,
+        constraint: GlobalConstraint,
+        changed: Optional[Variable]
+        ) -> bool:
+
+        removals = constraint.propagate(self.curr_domains, changed)
+        explanations = self.explanations
+        if removals is None:
+            if explanations is not None:
+                self.conflict = explanations.of(constraint.explain_failure())
+            return False
+
+        if explanations is not None:
+            # Explained against the domains the propagator saw
+            reasons = [
+                explanations.of(constraint.explain(variable, value))
+                for variable, value in removals
+            ]
+
+        # Values are pruned a variable at a time, which a bitset domain does in
+        # a single bitwise and
+        pruned: Dict[Variable, List[Value]] = {}
+        explained: Dict[Variable, int] = {}
+        for index, (variable, value) in enumerate(removals):
+            if not self.curr_domains.contains(variable, value):
+                continue
+            pruned.setdefault(variable, []).append(value)
+            if explanations is not None:
+                explained[variable] = explained.get(variable, 0) | reasons[index]
+
+        for variable, values in pruned.items():
+            self._prune_curr_domain(depth, variable, values)
+            if explanations is not None:
+                explanations.add(variable, explained[variable])
+            # Domain wipe-out
+            if self.curr_domains.size(variable) == 0:
+                if explanations is not None:
+                    self.conflict = explanations.masks[variable]
+                return False
+
+        for variable in pruned:
+            for related_constraint in self.vars_to_cons[variable]:
+                if related_constraint is not constraint:
+                    self.gac_queue.push(related_constraint, variable)
 
         return True
 
+    def _store_residue(self, constraint: Constraint, support: Assignment) -> None:
+        # A supporting tuple supports every value in it, not just the one that
+        # was being revised
+        for variable in constraint.scope:
+            self.residues[(constraint, variable)][support[variable]] = support
+
     def _restore_pruned_domains(self, depth: int) -> None:
-        for variable in self.pruned_domains_at_depth[depth]:
-            self.curr_domains[variable].extend(
-                self.pruned_domains_at_depth[depth][variable]
-            )
-        self.pruned_domains_at_depth.pop(depth)
+        restored = self.curr_domains.restore(depth)
+        if self.variable_ordering.dynamic:
+            for variable in restored:
+                self.unassigned_queue.update(variable)
 
     def _find_support(
         self,
@@ -155,6 +1735,8 @@ class CSP:
                 if is_satisfied:
                     return True
 
+            # Unbind so sibling branches above try this variable again
+            del support[variable]
             break
 
         return False
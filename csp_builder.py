@@ -1,33 +1,68 @@
-from typing import Dict, List, Set
+from typing import Dict, List, Optional, Union
 
-from csp import CSP, Constraint, Domain, Value, Variable
+from csp import (
+    ARC_QUEUE, CSP, GAC, Constraint, Domain, GlobalConstraint, MemoizedConstraint,
+    Value, Variable, tabulate
+)
+from domains import BACKENDS, BITSET, SPARSE_SET, is_compact_int_range
+from heuristics import ValueOrdering, VariableOrdering
 
 
 class CSPBuilder():
 
     def __init__(self) -> None:
-        self.variables: Set[Variable] = set()
+        # Kept in insertion order, which tie-breaks the variable orderings
+        self.variables: List[Variable] = []
         self.domains: Domain = {}
+        self.backends: Dict[Variable, str] = {}
         self.assigned_variables: List[Variable] = []
         self.constraints: List[Constraint] = []
         self.variables_to_constraints: Dict[Variable, List[Constraint]] = {}
 
-    def add_variable(self, variable: Variable, domain: List[Value]) -> None:
-        if variable in self.variables:
+    def add_variable(
+        self,
+        variable: Variable,
+        domain: List[Value],
+        backend: Optional[str] = None
+        ) -> None:
+        if variable in self.domains:
             raise KeyError(f"Variable {variable} already added")
+        if backend is not None and backend not in BACKENDS:
+            raise ValueError(f"Unknown domain backend '{backend}'")
 
-        self.variables.add(variable)
+        # Dense integer ranges are stored as bitsets unless told otherwise
+        if backend is None:
+            backend = BITSET if is_compact_int_range(domain) else SPARSE_SET
+
+        self.variables.append(variable)
         self.domains[variable] = domain
+        self.backends[variable] = backend
 
         if len(domain) == 1:
             self.assigned_variables.append(variable)
 
-    def add_constraint(self, constraint: Constraint) -> None:
+    def add_constraint(
+        self,
+        constraint: Constraint,
+        as_table: bool = False,
+        cache: Optional[int] = None
+        ) -> None:
+        """
+        Adds <constraint>, first converted to a table of its allowed tuples
+        over the current domains if <as_table> is set. <cache> memoizes up to
+        that many is_satisfied results; it is ignored for impure constraints
+        and for global ones, which filter domains with their own propagators.
+        """
         if len(constraint.scope) < 1:
             raise ValueError("Constraints must have at least one variable in scope")
         for variable in constraint.scope:
-            if variable not in self.variables:
+            if variable not in self.domains:
                 raise KeyError("Constraint scope contains unknown variable")
+        if as_table:
+            constraint = tabulate(constraint, self.domains)
+        elif cache is not None and constraint.pure and \
+            not isinstance(constraint, GlobalConstraint):
+            constraint = MemoizedConstraint(constraint, cache)
 
         self.constraints.append(constraint)
 
@@ -36,7 +71,16 @@ class CSPBuilder():
                 self.variables_to_constraints[variable] = []
             self.variables_to_constraints[variable].append(constraint)
 
-    def build(self) -> CSP:
+    def build(
+        self,
+        queue: str = ARC_QUEUE,
+        variable_ordering: Union[str, VariableOrdering] = "input",
+        value_ordering: Union[str, ValueOrdering] = "lexical",
+        propagation: str = GAC,
+        backjumping: bool = False,
+        learning: bool = False,
+        stats: bool = False
+        ) -> CSP:
         if len(self.variables) == 0:
             raise ValueError("No variables added")
         if len(self.domains) == 0:
@@ -49,5 +93,13 @@ class CSPBuilder():
             domains=self.domains,
             assigned_variables=self.assigned_variables,
             constraints=self.constraints,
-            vars_to_cons=self.variables_to_constraints
+            vars_to_cons=self.variables_to_constraints,
+            queue=queue,
+            backends=self.backends,
+            variable_ordering=variable_ordering,
+            value_ordering=value_ordering,
+            propagation=propagation,
+            backjumping=backjumping,
+            learning=learning,
+            stats=stats
         )
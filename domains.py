@@ -0,0 +1,273 @@
+from typing import Any, Dict, Hashable, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+
+# Mirrors the aliases in csp.py, which imports this module
+Value = Any
+Variable = Hashable
+Domain = Dict[Variable, List[Value]]
+Trail = List[Tuple[Any, Any]]
+
+SPARSE_SET = "sparse_set"
+BITSET = "bitset"
+
+
+class SparseSetDomain:
+    """
+    Domain of a single variable stored as a sparse set: <values> holds the live
+    values in its first <size> slots and the pruned values after them, and
+    <positions> maps each value to its slot. Removing a value swaps it past the
+    end of the live prefix, so both removal and its undo are O(1).
+    """
+
+    __slots__ = ("values", "positions", "size")
+
+    def __init__(self, values: List[Value]) -> None:
+        self.values: List[Value] = list(values)
+        self.positions: Dict[Value, int] = {
+            value: index for index, value in enumerate(self.values)
+        }
+        self.size: int = len(self.values)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, value: Value) -> bool:
+        index = self.positions.get(value)
+        return index is not None and index < self.size
+
+    def live(self) -> List[Value]:
+        return self.values[:self.size]
+
+    def min(self) -> Value:
+        return min(self.values[:self.size])
+
+    def max(self) -> Value:
+        return max(self.values[:self.size])
+
+    def restrict(self, values: Iterable[Value], trail: Trail) -> None:
+        allowed = set(values)
+        for value in self.values[:self.size]:
+            if value not in allowed:
+                trail.append((self, self.remove(value)))
+
+    def remove_all(self, values: Iterable[Value], trail: Trail) -> None:
+        for value in values:
+            if value in self:
+                trail.append((self, self.remove(value)))
+
+    def remove(self, value: Value) -> int:
+        index = self.positions[value]
+        last = self.size - 1
+        last_value = self.values[last]
+
+        self.values[index] = last_value
+        self.positions[last_value] = index
+        self.values[last] = value
+        self.positions[value] = last
+        self.size = last
+
+        # Undo token: the slot the value was swapped out of
+        return index
+
+    def undo(self, index: int) -> None:
+        # Undos are applied in LIFO order, so the value being restored is the
+        # one sitting right after the live prefix
+        value = self.values[self.size]
+        other = self.values[index]
+
+        self.values[index] = value
+        self.positions[value] = index
+        self.values[self.size] = other
+        self.positions[other] = self.size
+        self.size += 1
+
+
+class BitsetDomain:
+    """
+    Domain of a single integer variable stored as an arbitrary-precision int:
+    bit i of <mask> is set when <offset> + i is live. Size, min, max and
+    emptiness come straight from the mask, and a whole set of values can be
+    removed with a single bitwise and. Undo tokens are the previous masks.
+    """
+
+    __slots__ = ("offset", "mask", "size", "live_mask", "live_values")
+
+    def __init__(self, values: List[int]) -> None:
+        self.offset: int = min(values) if values else 0
+        self.mask: int = self.mask_of(values)
+        self.size: int = self.mask.bit_count()
+        # Value list of the most recently expanded mask; domains are read far
+        # more often than they change, so this avoids re-expanding the bits
+        self.live_mask: int = -1
+        self.live_values: List[int] = []
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, value: int) -> bool:
+        bit = value - self.offset
+        return bit >= 0 and (self.mask >> bit) & 1 == 1
+
+    def mask_of(self, values: Iterable[int]) -> int:
+        mask = 0
+        for value in values:
+            bit = value - self.offset
+            if bit >= 0:
+                mask |= 1 << bit
+        return mask
+
+    def live(self) -> List[int]:
+        if self.live_mask == self.mask:
+            return self.live_values
+
+        values = []
+        mask = self.mask
+        while mask:
+            lowest = mask & -mask
+            values.append(self.offset + lowest.bit_length() - 1)
+            mask ^= lowest
+
+        self.live_mask = self.mask
+        self.live_values = values
+        return values
+
+    def min(self) -> int:
+        return self.offset + (self.mask & -self.mask).bit_length() - 1
+
+    def max(self) -> int:
+        return self.offset + self.mask.bit_length() - 1
+
+    def restrict(self, values: Iterable[int], trail: Trail) -> None:
+        self.restrict_mask(self.mask_of(values), trail)
+
+    def remove_all(self, values: Iterable[int], trail: Trail) -> None:
+        self.restrict_mask(~self.mask_of(values), trail)
+
+    def restrict_mask(self, mask: int, trail: Trail) -> None:
+        restricted = self.mask & mask
+        if restricted != self.mask:
+            trail.append((self, self.mask))
+            self.mask = restricted
+            self.size = restricted.bit_count()
+
+    def remove(self, value: int) -> int:
+        previous = self.mask
+        if value in self:
+            self.mask = previous & ~(1 << (value - self.offset))
+            self.size -= 1
+        return previous
+
+    def undo(self, mask: int) -> None:
+        self.mask = mask
+        self.size = mask.bit_count()
+
+
+DomainBackend = Union[SparseSetDomain, BitsetDomain]
+
+BACKENDS = {
+    SPARSE_SET: SparseSetDomain,
+    BITSET: BitsetDomain,
+}
+
+
+def is_compact_int_range(values: List[Value]) -> bool:
+    """
+    True when <values> are distinct ints covering at least half of the range
+    between their min and max, which makes a bitset the cheaper backend
+    """
+    if len(values) == 0:
+        return False
+    for value in values:
+        if type(value) is not int:
+            return False
+    return len(set(values)) == len(values) and \
+        max(values) - min(values) + 1 <= 2 * len(values)
+
+
+class DomainStore:
+    """
+    Current domains of every variable, backed by a single global trail of
+    (domain, undo token) entries. <markers> records the trail size at the start
+    of each search depth, so backtracking to a depth replays exactly the
+    removals made since then, restoring the original value order. Any other
+    object with an undo(token) method can record its own changes on the trail
+    through push_undo, to be undone along with the domains.
+    """
+
+    def __init__(
+        self,
+        domains: Domain,
+        backends: Optional[Dict[Variable, str]] = None
+        ) -> None:
+
+        backends = backends or {}
+        self.domains: Dict[Variable, DomainBackend] = {}
+        self.owners: Dict[DomainBackend, Variable] = {}
+        for variable in domains:
+            backend = BACKENDS[backends.get(variable, SPARSE_SET)]
+            self.domains[variable] = backend(domains[variable])
+            self.owners[self.domains[variable]] = variable
+        self.trail: Trail = []
+        self.markers: List[int] = []
+
+    def __getitem__(self, variable: Variable) -> List[Value]:
+        # Callers must treat the returned list as read-only
+        return self.domains[variable].live()
+
+    def __iter__(self) -> Iterator[Variable]:
+        return iter(self.domains)
+
+    def __len__(self) -> int:
+        return len(self.domains)
+
+    def size(self, variable: Variable) -> int:
+        return self.domains[variable].size
+
+    def is_empty(self, variable: Variable) -> bool:
+        return self.domains[variable].size == 0
+
+    def contains(self, variable: Variable, value: Value) -> bool:
+        return value in self.domains[variable]
+
+    def min(self, variable: Variable) -> Value:
+        return self.domains[variable].min()
+
+    def max(self, variable: Variable) -> Value:
+        return self.domains[variable].max()
+
+    def remove(self, variable: Variable, value: Value) -> None:
+        domain = self.domains[variable]
+        self.trail.append((domain, domain.remove(value)))
+
+    def remove_all(self, variable: Variable, values: Iterable[Value]) -> None:
+        """
+        Removes those of <values> still in the domain of <variable>, with a
+        single bitwise and on a bitset domain
+        """
+        self.domains[variable].remove_all(values, self.trail)
+
+    def restrict(self, variable: Variable, values: Iterable[Value]) -> None:
+        """Intersects the domain of <variable> with <values>"""
+        self.domains[variable].restrict(values, self.trail)
+
+    def push_undo(self, owner: Any, token: Any) -> None:
+        self.trail.append((owner, token))
+
+    def mark(self, depth: int) -> None:
+        del self.markers[depth:]
+        self.markers.append(len(self.trail))
+
+    def restore(self, depth: int) -> Set[Variable]:
+        """Undoes every removal made since <depth>; returns the variables touched"""
+        target = self.markers[depth]
+        trail = self.trail
+        touched = set()
+        while len(trail) > target:
+            domain, token = trail.pop()
+            domain.undo(token)
+            touched.add(domain)
+        del self.markers[depth:]
+        return {self.owners[domain] for domain in touched if domain in self.owners}
+
+    def snapshot(self) -> Domain:
+        return {variable: list(self[variable]) for variable in self.domains}
@@ -0,0 +1,239 @@
+import heapq
+import random
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple, Union
+
+if TYPE_CHECKING:
+    from csp import CSP, Constraint, Value, Variable
+
+
+class VariableOrdering(ABC):
+    """
+    Strategy for picking the next variable to assign. The variable with the
+    lowest score is picked, ties going to the earliest in CSP.variables.
+    """
+
+    # Whether scores change during search. Dynamic orderings are re-scored
+    # whenever a domain or constraint weight they depend on changes
+    dynamic: bool = True
+
+    def attach(self, csp: 'CSP') -> None:
+        pass
+
+    @abstractmethod
+    def score(self, csp: 'CSP', variable: 'Variable') -> float:
+        pass
+
+    def on_wipeout(self, csp: 'CSP', constraint: 'Constraint') -> List['Variable']:
+        """Returns the variables whose score changed because of the wipe-out"""
+        return []
+
+
+class InputOrder(VariableOrdering):
+
+    dynamic = False
+
+    def attach(self, csp: 'CSP') -> None:
+        self.index = {var: index for index, var in enumerate(csp.variables)}
+
+    def score(self, csp: 'CSP', variable: 'Variable') -> float:
+        return self.index[variable]
+
+
+class MRV(VariableOrdering):
+
+    def score(self, csp: 'CSP', variable: 'Variable') -> float:
+        return csp.curr_domains.size(variable)
+
+
+class DomDeg(VariableOrdering):
+
+    def attach(self, csp: 'CSP') -> None:
+        self.degree = {
+            var: max(1, len(csp.vars_to_cons.get(var, []))) for var in csp.variables
+        }
+
+    def score(self, csp: 'CSP', variable: 'Variable') -> float:
+        return csp.curr_domains.size(variable) / self.degree[variable]
+
+
+class DomWdeg(VariableOrdering):
+    """
+    Domain size over weighted degree. Every constraint starts with weight 1
+    and gains 1 each time it wipes out a domain, steering search towards the
+    variables involved in the hardest parts of the problem. Only the sum of
+    those weights over each variable's constraints is kept, as <wdeg>.
+    """
+
+    def attach(self, csp: 'CSP') -> None:
+        self.wdeg: Dict['Variable', int] = {
+            var: max(1, len(csp.vars_to_cons.get(var, []))) for var in csp.variables
+        }
+
+    def score(self, csp: 'CSP', variable: 'Variable') -> float:
+        return csp.curr_domains.size(variable) / self.wdeg[variable]
+
+    def on_wipeout(self, csp: 'CSP', constraint: 'Constraint') -> List['Variable']:
+        for var in constraint.scope:
+            self.wdeg[var] += 1
+        return constraint.scope
+
+
+VARIABLE_ORDERINGS = {
+    "input": InputOrder,
+    "mrv": MRV,
+    "dom/deg": DomDeg,
+    "dom/wdeg": DomWdeg,
+}
+
+
+def make_variable_ordering(
+    ordering: Union[str, VariableOrdering]) -> VariableOrdering:
+    if isinstance(ordering, VariableOrdering):
+        return ordering
+    if ordering not in VARIABLE_ORDERINGS:
+        raise ValueError(f"Unknown variable ordering '{ordering}'")
+    return VARIABLE_ORDERINGS[ordering]()
+
+
+class ValueOrdering(ABC):
+    """
+    Strategy for the order in which a variable's live values are tried. Works
+    with any engine exposing <variables> and initial <domains>; LCV also needs
+    a count_supports(variable, value) method.
+    """
+
+    def attach(self, csp: Any) -> None:
+        pass
+
+    @abstractmethod
+    def order(
+        self, csp: Any, variable: 'Variable', values: List['Value']) -> List['Value']:
+        pass
+
+
+class LexicalOrder(ValueOrdering):
+    """Values in the order they were given in the variable's initial domain"""
+
+    def attach(self, csp: Any) -> None:
+        self.rank: Dict['Variable', Dict['Value', int]] = {
+            var: {value: index for index, value in enumerate(csp.domains[var])}
+            for var in csp.variables
+        }
+
+    def order(
+        self, csp: Any, variable: 'Variable', values: List['Value']) -> List['Value']:
+        return sorted(values, key=self.rank[variable].__getitem__)
+
+
+class RandomOrder(LexicalOrder):
+    """Seeded shuffle; values are ranked first so runs are reproducible"""
+
+    def __init__(self, seed: Optional[int] = None) -> None:
+        self.random = random.Random(seed)
+
+    def order(
+        self, csp: Any, variable: 'Variable', values: List['Value']) -> List['Value']:
+        ordered = super().order(csp, variable, values)
+        self.random.shuffle(ordered)
+        return ordered
+
+
+class LeastConstrainingValue(LexicalOrder):
+    """
+    Values that leave the most support in the neighbouring domains first. The
+    support count is estimated by the engine's count_supports, which only
+    looks at binary constraints with another unassigned variable.
+    """
+
+    def order(
+        self, csp: Any, variable: 'Variable', values: List['Value']) -> List['Value']:
+        ordered = super().order(csp, variable, values)
+        supports = {value: csp.count_supports(variable, value) for value in ordered}
+        # Stable sort keeps the lexical order between ties
+        return sorted(ordered, key=lambda value: -supports[value])
+
+
+class KeyOrder(ValueOrdering):
+    """Values sorted by a user-supplied key function"""
+
+    def __init__(self, key: Callable[['Value'], Any]) -> None:
+        self.key = key
+
+    def order(
+        self, csp: Any, variable: 'Variable', values: List['Value']) -> List['Value']:
+        return sorted(values, key=self.key)
+
+
+VALUE_ORDERINGS = {
+    "lexical": LexicalOrder,
+    "random": RandomOrder,
+    "lcv": LeastConstrainingValue,
+}
+
+
+def make_value_ordering(
+    ordering: Union[str, ValueOrdering],
+    seed: Optional[int] = None
+    ) -> ValueOrdering:
+    if isinstance(ordering, ValueOrdering):
+        return ordering
+    if ordering not in VALUE_ORDERINGS:
+        raise ValueError(f"Unknown value ordering '{ordering}'")
+    if ordering == "random":
+        return RandomOrder(seed)
+    return VALUE_ORDERINGS[ordering]()
+
+
+class VariableQueue:
+    """
+    Lazy min-heap of (score, tie-break, variable) entries. Every score change
+    pushes a fresh entry; stale entries are discarded when they surface, and
+    the heap is rebuilt once stale entries dominate it.
+    """
+
+    def __init__(self, csp: 'CSP', ordering: VariableOrdering) -> None:
+        self.csp = csp
+        self.ordering = ordering
+        self.tie_break = {var: index for index, var in enumerate(csp.variables)}
+        self.heap: List[Tuple[float, int, 'Variable']] = []
+        self._rebuild()
+
+    def push(self, variable: 'Variable') -> None:
+        heapq.heappush(self.heap, (
+            self.ordering.score(self.csp, variable),
+            self.tie_break[variable],
+            variable
+        ))
+        if len(self.heap) > 4 * len(self.tie_break) + 64:
+            self._rebuild()
+
+    def update(self, variable: 'Variable') -> None:
+        if self.ordering.dynamic and not self.csp.assigned[variable]:
+            self.push(variable)
+
+    def pop(self) -> Optional['Variable']:
+        heap = self.heap
+        while len(heap) > 0:
+            score, _, variable = heapq.heappop(heap)
+            if self.csp.assigned[variable]:
+                continue
+            if self.ordering.dynamic and \
+                score != self.ordering.score(self.csp, variable):
+                continue
+            return variable
+        return None
+
+    def shuffle_ties(self, rng: random.Random) -> None:
+        """Breaks score ties in a random order from now on"""
+        order = list(self.tie_break)
+        rng.shuffle(order)
+        self.tie_break = {var: index for index, var in enumerate(order)}
+        self._rebuild()
+
+    def _rebuild(self) -> None:
+        self.heap = [
+            (self.ordering.score(self.csp, var), self.tie_break[var], var)
+            for var in self.csp.variables if not self.csp.assigned[var]
+        ]
+        heapq.heapify(self.heap)
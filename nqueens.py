@@ -1,47 +1,296 @@
-import sys
-from typing import List, Tuple
+import argparse
+import itertools
+from typing import Callable, Iterator, List, Mapping, Optional, Set, Tuple
 
 from csp_builder import CSPBuilder
-from csp import Assignment, Constraint, Domain
+from csp import (
+    CSP, AllDifferent, Assignment, Constraint, GlobalConstraint, Removals,
+    SearchListener, SearchStats
+)
+from domains import DomainStore
+from heuristics import VALUE_ORDERINGS, VARIABLE_ORDERINGS, make_value_ordering
+from parallel import ParallelSolver
+from tracing import TraceRecorder
 
 
 QUEEN_CHAR = 'Q'
 NO_QUEEN_CHAR = '-'
 NO_QUEEN_INDEX = -1
 
+# Encodings of the "one queen per column" rule
+PAIRWISE = "pairwise"
+ALLDIFF = "alldiff"
+ALLDIFF_GAC = "alldiff-gac"
+ENCODINGS = [PAIRWISE, ALLDIFF, ALLDIFF_GAC]
+
+# Maps the square (row, col) of an n x n board to its image
+Symmetry = Callable[[int, int, int], Tuple[int, int]]
+
+
+# Rotations and reflections of the board. They are module-level functions so
+# that solvers holding them can be pickled for parallel workers
+def identity(n: int, row: int, col: int) -> Tuple[int, int]:
+    return row, col
+
+
+def rotate_90(n: int, row: int, col: int) -> Tuple[int, int]:
+    return col, n - 1 - row
+
+
+def rotate_180(n: int, row: int, col: int) -> Tuple[int, int]:
+    return n - 1 - row, n - 1 - col
+
+
+def rotate_270(n: int, row: int, col: int) -> Tuple[int, int]:
+    return n - 1 - col, row
+
+
+def reflect_columns(n: int, row: int, col: int) -> Tuple[int, int]:
+    return row, n - 1 - col
+
+
+def reflect_rows(n: int, row: int, col: int) -> Tuple[int, int]:
+    return n - 1 - row, col
+
+
+def transpose(n: int, row: int, col: int) -> Tuple[int, int]:
+    return col, row
+
+
+def anti_transpose(n: int, row: int, col: int) -> Tuple[int, int]:
+    return n - 1 - col, n - 1 - row
+
+
+# Identity first
+BOARD_SYMMETRIES: List[Symmetry] = [
+    identity, rotate_90, rotate_180, rotate_270,
+    reflect_columns, reflect_rows, transpose, anti_transpose,
+]
+
 
 class VerticalConstraint(Constraint):
+
     def is_satisfied(self, assignment: Assignment) -> bool:
         var1, var2 = self.scope
         return assignment[var1] != assignment[var2]
 
+    def filter_supported(
+        self,
+        variable: int,
+        values: List[int],
+        assignment: Assignment
+        ) -> List[bool]:
+        var1, var2 = self.scope
+        col = assignment[var2 if variable == var1 else var1]
+        return [value != col for value in values]
+
     def __repr__(self) -> str:
         return f"VC: {self.scope}"
 
 
 class DiagonalConstraint(Constraint):
+
     def is_satisfied(self, assignment: Assignment) -> bool:
         var1, var2 = self.scope
         return (var2 - var1) != (abs(assignment[var2] - assignment[var1]))
 
+    def filter_supported(
+        self,
+        variable: int,
+        values: List[int],
+        assignment: Assignment
+        ) -> List[bool]:
+        var1, var2 = self.scope
+        col = assignment[var2 if variable == var1 else var1]
+        return [(var2 - var1) != abs(value - col) for value in values]
+
     def __repr__(self) -> str:
         return f"DC: {self.scope}"
 
 
+class LexLeaderConstraint(GlobalConstraint):
+    """
+    The queens' columns, read row by row, are lexicographically no greater
+    than those of the board's image under <symmetry>. Posting one for every
+    symmetry of a group leaves a single solution of each orbit.
+    """
+
+    def __init__(self, scope: List[int], symmetry: Symmetry) -> None:
+        super().__init__(scope)
+        self.symmetry = symmetry
+        dimension = len(scope)
+        # Squares (row, col) whose queen lands in each row of the image, with
+        # the column it lands in
+        self.sources: List[List[Tuple[int, int, int]]] = [[] for _ in scope]
+        for row in range(dimension):
+            for col in range(dimension):
+                image_row, image_col = symmetry(dimension, row, col)
+                self.sources[image_row].append((row, col, image_col))
+
+    def is_satisfied(self, assignment: Assignment) -> bool:
+        dimension = len(self.scope)
+        image = [0] * dimension
+        for row in self.scope:
+            image_row, image_col = self.symmetry(dimension, row, assignment[row])
+            image[image_row] = image_col
+        return [assignment[row] for row in self.scope] <= image
+
+    def propagate(
+        self,
+        domains: DomainStore,
+        changed: Optional[int]
+        ) -> Optional[Removals]:
+
+        for row in self.scope:
+            col = domains[row][0] if domains.size(row) == 1 else None
+            image_col = self._image(domains, row)
+
+            # Rows above are equal, so this one must not exceed its image
+            if col is None and image_col is None:
+                return []
+            if col is None:
+                return [(row, value) for value in domains[row] if value > image_col]
+            if image_col is None:
+                return [
+                    (source_row, source_col)
+                    for source_row, source_col, lands_in in self.sources[row]
+                    if lands_in < col and domains.contains(source_row, source_col)
+                ]
+
+            if col < image_col:
+                return []
+            if col > image_col:
+                return None
+
+        return []
+
+    def _image(self, domains: DomainStore, row: int) -> Optional[int]:
+        # Column of the image's queen in <row>, once the queen mapped there is placed
+        for source_row, source_col, lands_in in self.sources[row]:
+            if domains.size(source_row) == 1 and domains[source_row][0] == source_col:
+                return lands_in
+        return None
+
+    def __repr__(self) -> str:
+        return f"LL: {self.scope}"
+
+
 class NQueensSolver():
 
-    def __init__(self, dimension: int, starting_queens: List[int]) -> None:
+    def __init__(
+        self,
+        dimension: int,
+        starting_queens: List[int],
+        encoding: str = ALLDIFF_GAC,
+        variable_ordering: str = "input",
+        value_ordering: str = "lexical",
+        seed: Optional[int] = None,
+        workers: int = 1,
+        break_symmetry: bool = False,
+        stats: bool = False,
+        listeners: Optional[List[SearchListener]] = None
+        ) -> None:
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unknown encoding '{encoding}'")
         self.dimension: int = dimension
         self.starting_queens: List[int] = starting_queens
+        self.encoding: str = encoding
+        self.variable_ordering: str = variable_ordering
+        self.value_ordering: str = value_ordering
+        self.seed: Optional[int] = seed
+        self.workers: int = workers
+        self.break_symmetry: bool = break_symmetry
+        self.collect_stats: bool = stats
+        # Statistics of the last CSP built, when collected
+        self.stats: Optional[SearchStats] = None
+        # Added to every CSP built; only sequential searches run them
+        self.listeners: List[SearchListener] = listeners or []
         self.builder: CSPBuilder = CSPBuilder()
-
-    def solve(self) -> Domain:
+        # Symmetries that map the starting queens onto themselves. Only these
+        # map solutions to solutions, so only these can be broken
+        self.symmetries: List[Symmetry] = self._stabilizer()
+
+    def solve(self) -> Optional[Mapping[int, int]]:
+        """
+        First solution, if any. With stats enabled, <stats> holds the
+        counters of the search afterwards, as it does after solutions()
+        and count()
+        """
+        return next(self.solutions(limit=1), None)
+
+    def solutions(self, limit: Optional[int] = None) -> Iterator[Mapping[int, int]]:
+        """
+        Every solution, up to <limit>. With symmetry breaking, the search
+        only finds one solution of each orbit and the rest are rebuilt from it
+        """
+        if not self.break_symmetry:
+            return self._search(limit)
+        orbits = (self.orbit(solution) for solution in self._search(None))
+        return itertools.islice(itertools.chain.from_iterable(orbits), limit)
+
+    def count(self, limit: Optional[int] = None) -> int:
+        if not self.break_symmetry:
+            if self.workers > 1:
+                return ParallelSolver(self.build, self.workers).count(limit)
+            return self.build().count(limit)
+
+        found = 0
+        for solution in self._search(None):
+            found += len(self.orbit(solution))
+            if limit is not None and found >= limit:
+                return limit
+        return found
+
+    def canonical_solutions(self, limit: Optional[int] = None) -> Iterator[Mapping[int, int]]:
+        """One solution of each orbit under the symmetries that are broken"""
+        return self._search(limit)
+
+    def orbit(self, solution: Mapping[int, int]) -> List[Mapping[int, int]]:
+        """Distinct images of <solution> under the symmetries that are broken"""
+        images: List[Mapping[int, int]] = []
+        seen: Set[Tuple[int, ...]] = set()
+        for symmetry in self.symmetries:
+            image = [0] * self.dimension
+            for row, col in solution.items():
+                image_row, image_col = symmetry(self.dimension, row, col)
+                image[image_row] = image_col
+            if tuple(image) not in seen:
+                seen.add(tuple(image))
+                images.append(dict(enumerate(image)))
+        return images
+
+    def _search(self, limit: Optional[int]) -> Iterator[Mapping[int, int]]:
+        if self.workers > 1:
+            return ParallelSolver(self.build, self.workers).solutions(limit)
+        return self.build().solutions(limit)
+
+    def _stabilizer(self) -> List[Symmetry]:
+        queens = {
+            (row, col) for row, col in enumerate(self.starting_queens)
+            if col != NO_QUEEN_INDEX
+        }
+        return [
+            symmetry for symmetry in BOARD_SYMMETRIES
+            if {symmetry(self.dimension, row, col) for row, col in queens} == queens
+        ]
+
+    def model(self) -> CSPBuilder:
+        # Fresh builder each time, so parallel workers can each build a copy
+        self.builder = CSPBuilder()
         self._add_variables()
         self._add_constraints()
-        csp = self.builder.build()
-        _, solution = csp.satisfy()
-
-        return solution
+        return self.builder
+
+    def build(self) -> CSP:
+        csp = self.model().build(
+            variable_ordering=self.variable_ordering,
+            value_ordering=make_value_ordering(self.value_ordering, self.seed),
+            stats=self.collect_stats
+        )
+        self.stats = csp.stats
+        for listener in self.listeners:
+            csp.add_listener(listener)
+        return csp
 
     def _add_variables(self) -> None:
         for var in range(self.dimension):
@@ -53,8 +302,19 @@ class NQueensSolver():
     def _add_constraints(self) -> None:
         self._add_vertical_constraints()
         self._add_diagonal_constraints()
+        if self.break_symmetry:
+            self._add_symmetry_breaking_constraints()
 
     def _add_vertical_constraints(self) -> None:
+        if self.encoding == ALLDIFF:
+            variables = list(range(self.dimension))
+            self.builder.add_constraint(AllDifferent(variables, AllDifferent.ELIMINATION))
+            return
+        if self.encoding == ALLDIFF_GAC:
+            variables = list(range(self.dimension))
+            self.builder.add_constraint(AllDifferent(variables, AllDifferent.GAC))
+            return
+
         for var1 in range(self.dimension):
             for var2 in range(var1 + 1, self.dimension, 1):
                 constraint = VerticalConstraint([var1, var2])
@@ -66,32 +326,76 @@ class NQueensSolver():
                 constraint = DiagonalConstraint([var1, var2])
                 self.builder.add_constraint(constraint)
 
-
-def main(input_filename: str) -> None:
+    def _add_symmetry_breaking_constraints(self) -> None:
+        variables = list(range(self.dimension))
+        # The identity is always first and needs no constraint
+        for symmetry in self.symmetries[1:]:
+            self.builder.add_constraint(LexLeaderConstraint(variables, symmetry))
+
+
+def main(
+    input_filename: str,
+    encoding: str = ALLDIFF_GAC,
+    variable_ordering: str = "input",
+    value_ordering: str = "lexical",
+    seed: Optional[int] = None,
+    all_solutions: bool = False,
+    count: bool = False,
+    limit: Optional[int] = None,
+    workers: int = 1,
+    break_symmetry: bool = False,
+    stats: bool = False,
+    trace_filename: Optional[str] = None
+    ) -> None:
     dimension, starting_queens = read_input(input_filename)
-    solver = NQueensSolver(dimension, starting_queens)
-    solution = solver.solve()
-    print_solution(dimension, solution)
+    trace_file = open(trace_filename, 'w') if trace_filename is not None else None
+    solver = NQueensSolver(
+        dimension, starting_queens, encoding, variable_ordering, value_ordering,
+        seed, workers, break_symmetry, stats,
+        [TraceRecorder(trace_file)] if trace_file is not None else None
+    )
+
+    try:
+        if count:
+            print(solver.count(limit))
+        elif all_solutions:
+            found = 0
+            for solution in solver.solutions(limit):
+                print_solution(dimension, solution)
+                found += 1
+            print(f"{found} solutions found")
+        else:
+            print_solution(dimension, solver.solve())
+    finally:
+        if trace_file is not None:
+            trace_file.close()
+
+    if solver.stats is not None:
+        print(solver.stats)
 
 
 def read_input(input_filename: str) -> Tuple[int, List[int]]:
 
-    dimension = 0
+    with open(input_filename, mode='r') as input_file:
+        return parse_input(input_file.readlines())
+
+
+def parse_input(lines: List[str]) -> Tuple[int, List[int]]:
+
+    dimension = int(lines[0])
     starting_queens: List[int] = []
 
-    with open(input_filename, mode='r') as input_file:
-        dimension = int(input_file.readline())
-        for line in input_file:
-            char = line.strip()
-            if char == NO_QUEEN_CHAR:
-                starting_queens.append(NO_QUEEN_INDEX)
-            else:
-                starting_queens.append(int(char))
+    for line in lines[1:]:
+        char = line.strip()
+        if char == NO_QUEEN_CHAR:
+            starting_queens.append(NO_QUEEN_INDEX)
+        else:
+            starting_queens.append(int(char))
 
     return dimension, starting_queens
 
 
-def print_solution(dimension: int, solution: Domain) -> None:
+def print_solution(dimension: int, solution: Optional[Mapping[int, int]]) -> None:
 
     if not solution:
         print("No valid solutions found")
@@ -104,7 +408,7 @@ def print_solution(dimension: int, solution: Domain) -> None:
         grid.append([NO_QUEEN_CHAR for j in range(dimension)])
 
     for variable in solution:
-        queen_index = solution[variable][0]
+        queen_index = solution[variable]
         grid[variable][queen_index] = QUEEN_CHAR
 
     header_str = "  " + SPACING.join([str(i) for i in range(dimension)])
@@ -118,7 +422,56 @@ def print_solution(dimension: int, solution: Domain) -> None:
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python3 nqueens.py <input_file>")
-        exit()
-    main(sys.argv[1])
+    parser = argparse.ArgumentParser(description="Solves an N-Queens puzzle")
+    parser.add_argument("input_file")
+    parser.add_argument(
+        "--encoding", choices=ENCODINGS, default=ALLDIFF_GAC,
+        help="how the one-queen-per-column rule is modelled"
+    )
+    parser.add_argument(
+        "--variable-order", choices=list(VARIABLE_ORDERINGS), default="input",
+        help="heuristic used to pick the next row to place a queen in"
+    )
+    parser.add_argument(
+        "--value-order", choices=list(VALUE_ORDERINGS), default="lexical",
+        help="order in which the columns of a row are tried"
+    )
+    parser.add_argument(
+        "--seed", type=int, default=None, help="seed for --value-order random"
+    )
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--all", action="store_true", help="print every solution as it is found"
+    )
+    mode.add_argument(
+        "--count", action="store_true", help="only print the number of solutions"
+    )
+    parser.add_argument(
+        "--limit", type=int, default=None,
+        help="stop after this many solutions with --all or --count"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="number of processes to split the search across"
+    )
+    parser.add_argument(
+        "--break-symmetry", action="store_true",
+        help="only search one solution of each set of rotations and reflections"
+    )
+    parser.add_argument(
+        "--stats", action="store_true",
+        help="print search statistics, with time spent per constraint class"
+    )
+    parser.add_argument(
+        "--trace", default=None, metavar="TRACE_FILE",
+        help="record every search event to this JSON lines file, "
+        "to be summarized with tracing.py"
+    )
+    args = parser.parse_args()
+    if (args.stats or args.trace) and args.workers > 1:
+        parser.error("--stats and --trace are only supported by a single sequential search")
+    main(
+        args.input_file, args.encoding, args.variable_order,
+        args.value_order, args.seed, args.all, args.count, args.limit,
+        args.workers, args.break_symmetry, args.stats, args.trace
+    )
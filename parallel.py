@@ -0,0 +1,154 @@
+import multiprocessing
+import os
+import queue
+from collections import deque
+from types import MappingProxyType
+from typing import Any, Callable, Deque, Iterator, List, Mapping, Optional, Tuple
+
+from csp import CSP, Assignment, SearchState, Value, Variable
+
+
+# Nodes a worker searches between checks for idle workers to split work for
+NODE_BUDGET = 256
+
+# Worker-side view of how many workers are waiting for work
+_hungry: Any = None
+
+# Solutions found, solutions kept (all mode only), states handed back to the
+# pool and nodes visited by one task
+TaskResult = Tuple[int, List[Assignment], List[SearchState], int]
+
+
+def _init_worker(hungry: Any) -> None:
+    global _hungry
+    _hungry = hungry
+
+
+def _run_task(
+    factory: Callable[[], CSP],
+    state: SearchState,
+    keep_solutions: bool,
+    limit: Optional[int],
+    node_budget: int
+    ) -> TaskResult:
+
+    csp = factory()
+    csp.restore_search(state)
+    start_nodes = csp.nodes
+    found = 0
+    solutions: List[Assignment] = []
+
+    while limit is None or found < limit:
+        result = csp.search(node_limit=node_budget)
+
+        if result is None:
+            if _hungry.value <= 0:
+                continue
+            # Give the shallowest unexplored branches to the idle workers and
+            # hand this search back to be rescheduled alongside them
+            stolen = csp.split_search()
+            if stolen is None:
+                continue
+            donated = [stolen, csp.snapshot_search()]
+            return found, solutions, donated, csp.nodes - start_nodes
+
+        if not result:
+            break
+        found += 1
+        if keep_solutions:
+            solutions.append(csp.assignment())
+
+    return found, solutions, [], csp.nodes - start_nodes
+
+
+class ParallelSolver:
+    """
+    Searches a CSP on a pool of worker processes. Each task is a SearchState:
+    a prefix of decisions that fixes a subtree. A task starts as the whole
+    tree. Whenever a worker is idle, a busy worker splits off the untried
+    values of its shallowest choice point and returns both halves, so work
+    flows to idle workers.
+
+    <factory> builds a fresh copy of the CSP in each worker and must be
+    picklable, such as a module-level function or a bound method of a
+    picklable object. The first solution found may differ from the one a
+    sequential search finds first.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], CSP],
+        workers: Optional[int] = None,
+        node_budget: int = NODE_BUDGET
+        ) -> None:
+        self.factory = factory
+        self.workers = workers or os.cpu_count() or 1
+        self.node_budget = node_budget
+        # Search nodes visited across all workers
+        self.nodes = 0
+
+    def solve(self) -> Optional[Mapping[Variable, Value]]:
+        return next(self.solutions(limit=1), None)
+
+    def solutions(self, limit: Optional[int] = None) -> Iterator[Mapping[Variable, Value]]:
+        found = 0
+        for _, solutions in self._run(True, limit):
+            for solution in solutions:
+                if limit is not None and found >= limit:
+                    return
+                found += 1
+                yield MappingProxyType(solution)
+
+    def count(self, limit: Optional[int] = None) -> int:
+        found = 0
+        for task_found, _ in self._run(False, limit):
+            found += task_found
+        if limit is not None:
+            return min(found, limit)
+        return found
+
+    def _run(
+        self,
+        keep_solutions: bool,
+        limit: Optional[int]
+        ) -> Iterator[Tuple[int, List[Assignment]]]:
+
+        context = multiprocessing.get_context()
+        hungry = context.Value('i', 0, lock=False)
+        results: queue.Queue = queue.Queue()
+        pending: Deque[SearchState] = deque([SearchState([], True, 0)])
+        running = 0
+        found = 0
+
+        pool = context.Pool(self.workers, initializer=_init_worker, initargs=(hungry,))
+        try:
+            while len(pending) > 0 or running > 0:
+
+                while len(pending) > 0 and running < self.workers:
+                    task_limit = None if limit is None else limit - found
+                    pool.apply_async(
+                        _run_task,
+                        (self.factory, pending.popleft(), keep_solutions,
+                            task_limit, self.node_budget),
+                        callback=results.put,
+                        error_callback=results.put
+                    )
+                    running += 1
+                hungry.value = self.workers - running - len(pending)
+
+                result = results.get()
+                running -= 1
+                if isinstance(result, BaseException):
+                    raise result
+
+                task_found, solutions, donated, nodes = result
+                self.nodes += nodes
+                found += task_found
+                pending.extend(donated)
+                yield task_found, solutions
+
+                if limit is not None and found >= limit:
+                    break
+        finally:
+            pool.terminate()
+            pool.join()
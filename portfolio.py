@@ -0,0 +1,140 @@
+import multiprocessing
+import time
+from types import MappingProxyType
+from typing import Any, List, Mapping, Optional, Tuple
+
+from csp import ARC_QUEUE, CSP, FORWARD_CHECKING, GAC, Assignment, Value, Variable
+from csp_builder import CSPBuilder
+from heuristics import make_value_ordering
+
+
+class Configuration:
+    """One way of searching a model: orderings, seed and propagation level"""
+
+    def __init__(
+        self,
+        variable_ordering: str = "input",
+        value_ordering: str = "lexical",
+        propagation: str = GAC,
+        seed: Optional[int] = None,
+        queue: str = ARC_QUEUE
+        ) -> None:
+        self.variable_ordering = variable_ordering
+        self.value_ordering = value_ordering
+        self.propagation = propagation
+        self.seed = seed
+        self.queue = queue
+
+    def build(self, model: CSPBuilder) -> CSP:
+        return model.build(
+            queue=self.queue,
+            variable_ordering=self.variable_ordering,
+            value_ordering=make_value_ordering(self.value_ordering, self.seed),
+            propagation=self.propagation
+        )
+
+    def __repr__(self) -> str:
+        name = f"{self.variable_ordering}/{self.value_ordering}/{self.propagation}"
+        if self.seed is not None:
+            name += f"/seed={self.seed}"
+        return name
+
+
+DEFAULT_PORTFOLIO = [
+    Configuration("mrv", "lexical", FORWARD_CHECKING),
+    Configuration("mrv", "lcv", FORWARD_CHECKING),
+    Configuration("dom/wdeg", "lexical", GAC),
+    Configuration("mrv", "lcv", GAC),
+    Configuration("dom/wdeg", "random", FORWARD_CHECKING, seed=1),
+    Configuration("dom/deg", "random", GAC, seed=2),
+]
+
+
+class PortfolioResult:
+    """Answer of the first configuration to finish, and which one it was"""
+
+    def __init__(
+        self,
+        solution: Optional[Mapping[Variable, Value]],
+        winner: Configuration,
+        nodes: int,
+        seconds: float
+        ) -> None:
+        self.solution = solution
+        self.winner = winner
+        self.nodes = nodes
+        self.seconds = seconds
+
+    @property
+    def solved(self) -> bool:
+        return self.solution is not None
+
+    def __str__(self) -> str:
+        outcome = "solved" if self.solved else "proved unsatisfiable"
+        return f"{self.winner} {outcome} in {self.nodes} nodes, {self.seconds:.3f}s"
+
+
+# Model shared by every worker of the pool. Under the fork start method it is
+# inherited from the parent rather than rebuilt or pickled per worker
+_model: Any = None
+
+# Configuration index, solution (None when unsatisfiable), nodes, seconds
+RaceResult = Tuple[int, Optional[Assignment], int, float]
+
+
+def _init_worker(model: CSPBuilder) -> None:
+    global _model
+    _model = model
+
+
+def _race(task: Tuple[int, Configuration]) -> RaceResult:
+    index, configuration = task
+    start = time.perf_counter()
+    csp = configuration.build(_model)
+    solution = csp.assignment() if csp.search() else None
+    return index, solution, csp.nodes, time.perf_counter() - start
+
+
+class PortfolioSolver:
+    """
+    Races several configurations of the same model in separate processes,
+    keeps the first answer and terminates the rest. An unsatisfiable answer
+    counts as an answer, since any complete configuration proves it.
+    """
+
+    def __init__(
+        self,
+        model: CSPBuilder,
+        configurations: List[Configuration] = DEFAULT_PORTFOLIO,
+        workers: Optional[int] = None
+        ) -> None:
+        if len(configurations) == 0:
+            raise ValueError("Portfolio needs at least one configuration")
+        self.model = model
+        self.configurations = configurations
+        # One process per configuration by default, so every configuration
+        # races from the start
+        self.workers = workers or len(configurations)
+
+    def solve(self) -> PortfolioResult:
+        if "fork" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("fork")
+        else:
+            context = multiprocessing.get_context()
+
+        pool = context.Pool(
+            self.workers, initializer=_init_worker, initargs=(self.model,)
+        )
+        try:
+            results = pool.imap_unordered(_race, enumerate(self.configurations))
+            index, solution, nodes, seconds = next(results)
+        finally:
+            pool.terminate()
+            pool.join()
+
+        return PortfolioResult(
+            None if solution is None else MappingProxyType(solution),
+            self.configurations[index],
+            nodes,
+            seconds
+        )
@@ -0,0 +1,64 @@
+import itertools
+from abc import ABC, abstractmethod
+from typing import Iterator, Union
+
+
+def luby(index: int) -> int:
+    """<index>-th term (1-based) of the Luby sequence 1, 1, 2, 1, 1, 2, 4, ..."""
+    size = 1
+    while size < index + 1:
+        size = 2 * size + 1
+    while True:
+        if index == size:
+            return (size + 1) // 2
+        size //= 2
+        if index > size:
+            index -= size
+
+
+class RestartSchedule(ABC):
+    """Failure cutoffs of successive runs of a restarting search"""
+
+    @abstractmethod
+    def __iter__(self) -> Iterator[int]:
+        pass
+
+
+class LubySchedule(RestartSchedule):
+
+    def __init__(self, base: int = 100) -> None:
+        self.base = base
+
+    def __iter__(self) -> Iterator[int]:
+        for index in itertools.count(1):
+            yield self.base * luby(index)
+
+
+class GeometricSchedule(RestartSchedule):
+
+    def __init__(self, base: int = 100, factor: float = 1.5) -> None:
+        if factor <= 1:
+            raise ValueError("Geometric restart factor must be greater than 1")
+        self.base = base
+        self.factor = factor
+
+    def __iter__(self) -> Iterator[int]:
+        cutoff = float(self.base)
+        while True:
+            yield int(cutoff)
+            cutoff *= self.factor
+
+
+RESTART_SCHEDULES = {
+    "luby": LubySchedule,
+    "geometric": GeometricSchedule,
+}
+
+
+def make_restart_schedule(
+    schedule: Union[str, RestartSchedule], base: int = 100) -> RestartSchedule:
+    if isinstance(schedule, RestartSchedule):
+        return schedule
+    if schedule not in RESTART_SCHEDULES:
+        raise ValueError(f"Unknown restart schedule '{schedule}'")
+    return RESTART_SCHEDULES[schedule](base)
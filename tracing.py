@@ -0,0 +1,136 @@
+import argparse
+import json
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, TextIO, Tuple
+
+from csp import Assignment, Constraint, SearchListener, Value, Variable
+
+
+class TraceRecorder(SearchListener):
+    """
+    Streams the events of a search to <file> as JSON lines, such as
+    {"event": "assign", "depth": 2, "variable": 5, "value": 1}. Variables and
+    values that JSON cannot represent are written as their repr().
+    """
+
+    def __init__(self, file: TextIO) -> None:
+        self.file = file
+
+    def on_assign(self, depth: int, variable: Variable, value: Value) -> None:
+        self._write({"event": "assign", "depth": depth, "variable": variable, "value": value})
+
+    def on_prune(self, depth: int, variable: Variable, values: List[Value]) -> None:
+        self._write({"event": "prune", "depth": depth, "variable": variable, "values": values})
+
+    def on_wipeout(self, depth: int, constraint: Constraint) -> None:
+        self._write({"event": "wipeout", "depth": depth, "constraint": repr(constraint)})
+
+    def on_backtrack(self, depth: int) -> None:
+        self._write({"event": "backtrack", "depth": depth})
+
+    def on_restart(self) -> None:
+        self._write({"event": "restart"})
+
+    def on_solution(self, assignment: Assignment) -> None:
+        self._write({"event": "solution"})
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        self.file.write(json.dumps(record, default=repr, separators=(",", ":")))
+        self.file.write("\n")
+
+
+# Decisions from the root down to a subtree, each a JSON-encoded
+# (variable, value) pair so that they can be used as keys
+Path = Tuple[str, ...]
+
+
+class TraceSummary:
+    """
+    Totals of a recorded search: events by kind, failed assignments by
+    variable, wipe-outs by constraint, and the nodes and failures in every
+    subtree rooted <depth> decisions below the root.
+    """
+
+    def __init__(self, depth: int = 3) -> None:
+        self.depth = depth
+        self.events: Counter = Counter()
+        self.failures: Counter = Counter()
+        self.wipeouts: Counter = Counter()
+        self.subtree_nodes: Counter = Counter()
+        self.subtree_failures: Counter = Counter()
+        self.path: List[str] = []
+        # Variable of the assignment whose propagation is under way
+        self.current: Optional[str] = None
+
+    def add(self, record: Dict[str, Any]) -> None:
+        event = record["event"]
+        self.events[event] += 1
+
+        if event == "assign":
+            depth = record["depth"]
+            variable = json.dumps(record["variable"])
+            del self.path[depth:]
+            self.path.append(json.dumps([record["variable"], record["value"]]))
+            self.current = variable
+            if depth + 1 >= self.depth:
+                self.subtree_nodes[tuple(self.path[:self.depth])] += 1
+
+        elif event == "wipeout":
+            self.wipeouts[record["constraint"]] += 1
+            if self.current is not None:
+                self.failures[self.current] += 1
+                self.current = None
+            if record["depth"] + 1 >= self.depth:
+                self.subtree_failures[tuple(self.path[:self.depth])] += 1
+
+        elif event == "restart":
+            self.path.clear()
+
+    def hot_subtrees(self, top: int) -> List[Tuple[Path, int, int]]:
+        """The <top> subtrees with the most failures, with nodes and failures"""
+        return [
+            (path, self.subtree_nodes[path], failures)
+            for path, failures in self.subtree_failures.most_common(top)
+        ]
+
+
+def summarize(lines: Iterable[str], depth: int = 3) -> TraceSummary:
+    summary = TraceSummary(depth)
+    for line in lines:
+        if line.strip():
+            summary.add(json.loads(line))
+    return summary
+
+
+def print_summary(summary: TraceSummary, top: int = 10) -> None:
+    print("Events:")
+    for event, count in sorted(summary.events.items()):
+        print(f"  {event:<10} {count}")
+
+    print("Variables with the most failed assignments:")
+    for variable, count in summary.failures.most_common(top):
+        print(f"  {count:>8}  {variable}")
+
+    print("Constraints with the most wipe-outs:")
+    for constraint, count in summary.wipeouts.most_common(top):
+        print(f"  {count:>8}  {constraint}")
+
+    print(f"Hot subtrees ({summary.depth} decisions below the root):")
+    print(f"  {'nodes':>8}  {'failures':>8}  path")
+    for path, nodes, failures in summary.hot_subtrees(top):
+        print(f"  {nodes:>8}  {failures:>8}  {' > '.join(path)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarizes a recorded search trace")
+    parser.add_argument("trace_file")
+    parser.add_argument(
+        "--top", type=int, default=10, help="number of entries to list per table"
+    )
+    parser.add_argument(
+        "--depth", type=int, default=3,
+        help="number of decisions from the root that identify a subtree"
+    )
+    args = parser.parse_args()
+    with open(args.trace_file) as trace_file:
+        print_summary(summarize(trace_file, args.depth), args.top)